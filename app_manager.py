@@ -60,18 +60,19 @@ def custom_config(config_file):
     app.run(host='0.0.0.0', port=8080)
 
 
-@manager.command
-def celery():
+@manager.option('-q', dest='queue', required=False, help='Judge queue name')
+def celery(queue):
     """
-    Run celery worker.
+    Run celery worker of a judge queue. By default the worker of the least urgent
+    queue will be run, which consumes all the queues.
     """
     app = create_app()
     from mongoengine.connection import disconnect
-    from project.extensions import celery
+    from project.extensions import celery, judge_queues
     from celery.bin import worker
     disconnect()
     worker = worker.worker(app=celery)
-    worker.run()
+    worker.run(**judge_queues.worker_options(queue))
 
 
 @manager.option('-r', dest='resource', required=False, help='Resource name')
@@ -83,3 +84,13 @@ def test(resource, url):
     """
     from tests import run
     run(url, resource)
+
+
+@manager.option('-n', dest='count', required=False, type=int, default=100000, help='Objects of each benchmark')
+def benchmark(count):
+    """
+    Benchmark mapping raw list rows into documents and into read records (objects/sec).
+    """
+    create_app(TestingConfig)
+    from tests.benchmark import run
+    run(count)
@@ -5,16 +5,18 @@ __author__ = 'AminHP'
 
 # python imports
 import os
+import sys
 from mongoengine.connection import disconnect
 from celery.bin import worker
 
 # project imports
 from deploy import app
-from project.extensions import celery
+from project.extensions import celery, judge_queues
 
 
 disconnect()
 worker = worker.worker(app=celery)
 
 if __name__ == '__main__':
-    worker.run()
+    queue = sys.argv[1] if len(sys.argv) > 1 else None
+    worker.run(**judge_queues.worker_options(queue))
@@ -15,6 +15,8 @@ class DefaultConfig(object):
     TESTING = True
     DEPLOYMENT = False
     TOKEN_EXPIRE_TIME = 5 * 3600
+    USER_CACHE_SIZE = 1024 # authenticated users kept in each process
+    USER_CACHE_TIMEOUT = 30
 
     # directory
 
@@ -27,6 +29,10 @@ class DefaultConfig(object):
     PROBLEM_DIR = os.path.join(MEDIA_DIR, 'Problems')
     TESTCASE_DIR = os.path.join(MEDIA_DIR, 'Testcases')
     SUBMISSION_DIR = os.path.join(MEDIA_DIR, 'Submissions')
+    JUDGE_POOL_DIR = os.path.join(TEMP_DIR, 'Judge')
+    JUDGE_LOCAL_DIR = os.path.join(TEMP_DIR, 'Sandbox')
+    JUDGE_COMPILE_CACHE_DIR = os.path.join(TEMP_DIR, 'Compiled')
+    JUDGE_CPU_LOCK_DIR = os.path.join(TEMP_DIR, 'JudgeCpus')
 
     # form
 
@@ -41,6 +47,11 @@ class DefaultConfig(object):
 
     DEFAULT_PAGE_SIZE = 10
 
+    # query guard
+
+    QUERY_GUARD_STRICT = False # fail the routes which run more queries than their limit
+    PAGINATE_COUNT_TIMEOUT = 30 # seconds a cursor list total is cached
+
     # cache
 
     CACHE_TYPE = 'null'
@@ -57,6 +68,48 @@ class DefaultConfig(object):
 
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
+    CELERY_DEFAULT_QUEUE = 'celery'
+    CELERY_ACKS_LATE = True
+    CELERYD_PREFETCH_MULTIPLIER = 1 # a busy worker doesn't hold back queued submissions
+    BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority'}
+
+    # judge queues (in priority order, with the worker concurrency of each one)
+
+    JUDGE_QUEUES = [
+        ('judge_contest', 2),
+        ('judge_test', 1),
+        ('judge_rejudge', 1)
+    ]
+    JUDGE_REJUDGE_BATCH_SIZE = 20 # submissions in each rejudge task
+    JUDGE_REJUDGE_JOB_TIMEOUT = 24 * 3600
+    JUDGE_TIME_SMOOTHING = 0.1 # weight of the last judge time in the average which wait estimates use
+    JUDGE_TASK_LEASE = 30 * 60 # a popped submission not judged by then is queued again (keep it below the broker visibility timeout)
+    JUDGE_TASK_ATTEMPTS = 3 # then it gets the JudgeError status
+
+    # judge
+
+    JUDGE_BACKEND = 'docker' # 'docker' or 'local'
+    JUDGE_CPUS = None # cpus which sandboxes are pinned to (None means all)
+    JUDGE_CONCURRENCY = 1 # testcases which are run at the same time
+    JUDGE_POOL_ENABLED = True # reuse docker containers between submissions
+    JUDGE_POOL_SIZE = 2 # containers per language in each worker process
+    JUDGE_POOL_MAX_USES = 100
+    JUDGE_POOL_LEASE_TIMEOUT = 60
+    JUDGE_LOCAL_USER = 'restricted_user' # used only when the worker runs as root
+    JUDGE_LOCAL_CGROUP = None # writable cgroup directory, e.g. /sys/fs/cgroup/ijudge
+    JUDGE_COMPILE_CACHE_SIZE = 512 * 1024 * 1024
+    VERDICT_CACHE_TIMEOUT = 7 * 24 * 3600
+    VERDICT_POLL_TIMEOUT = 25 # longest wait of a verdict poll in seconds
+    VERDICT_POLL_HISTORY = 100 # verdicts kept for each team
+    VERDICT_POLL_EXPIRE = 7 * 24 * 3600
+
+    # scoreboard
+
+    SCOREBOARD_TIMEOUT = 30 * 24 * 3600 # live results are seeded from mongo again after this
+    SCOREBOARD_PERSIST_DELAY = 5 # seconds between persisting live results into mongo
+    SCOREBOARD_DELTA_HISTORY = 1000 # deltas kept for resuming streams
+    SCOREBOARD_KEEPALIVE = 15
+    RESULT_CACHE_TIMEOUT = 300
 
     # mongo
 
@@ -108,6 +161,7 @@ class TestingConfig(DefaultConfig):
 
     DEBUG = True
     TESTING = True
+    QUERY_GUARD_STRICT = True
 
     # cache
 
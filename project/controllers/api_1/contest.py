@@ -2,23 +2,26 @@
 __author__ = 'AminHP'
 
 # python imports
-import os
-import shutil
-import zipfile
 import StringIO
 import base64
+from gevent.queue import Empty
 
 # flask imports
 from flask import jsonify, request, g, send_file, abort
 
 # project imports
 from project import app
-from project.extensions import db, auth
+from project.extensions import db, auth, scoreboard, query_guard
 from project.modules.datetime import utcnowts
 from project.modules.paginator import paginate
+from project.modules.etag import make_etag, is_not_modified, etag_response, not_modified_response
+from project.modules.sse import sse_event, sse_comment, sse_response
+from project.modules.loader import field_id
+from project.modules.permissions import user_id, is_owner, is_contest_admin, is_contest_member
 from project.models.contest import Contest, Problem, ContestDateTimeError
 from project.models.team import Team
 from project.models.user import User
+from project.models.records import ContestRecord
 from project.forms.problem import UploadProblemBody, UploadTestCase
 
 
@@ -54,6 +57,9 @@ def create():
             ends_at:
               type: integer
               description: Contest ends_at (utc timestamp)
+            fail_fast:
+              type: boolean
+              description: Stop judging a submission at its first failed testcase (default is true), otherwise the reason has the verdict of each failed testcase
             recaptcha:
               type: string
       - name: Access-Token
@@ -79,7 +85,7 @@ def create():
     json = request.json
     try:
         obj = Contest()
-        obj.owner = User.objects.get(pk=g.user_id)
+        obj.owner = g.user
         obj.populate(json)
         obj.save()
         return jsonify(obj.to_json()), 201
@@ -149,6 +155,9 @@ def info(cid):
             is_ended:
               type: boolean
               description: Contest is_ended
+            fail_fast:
+              type: boolean
+              description: Contest fail_fast
             is_owner:
               type: boolean
               description: Contest is_owner
@@ -191,8 +200,12 @@ def info(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
-        return jsonify(obj.to_json_user(user_obj)), 200
+        ## the joining status depends on the teams of the user too
+        etag = make_etag('info', cid, g.user_id, obj.version, obj.stage, Team.teams_version(g.user_id))
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        return etag_response(obj.to_json_user(g.user), etag)
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest does not exist")
 
@@ -230,6 +243,9 @@ def edit(cid):
             ends_at:
               type: integer
               description: Contest ends_at (utc timestamp)
+            fail_fast:
+              type: boolean
+              description: Stop judging a submission at its first failed testcase, otherwise the reason has the verdict of each failed testcase
       - name: Access-Token
         in: header
         type: string
@@ -257,9 +273,8 @@ def edit(cid):
     json = request.json
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         obj.populate(json)
@@ -306,9 +321,8 @@ def delete(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if user_obj != obj.owner:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the contest")
 
         obj.delete()
@@ -318,7 +332,8 @@ def delete(cid):
 
 
 @app.api_route('', methods=['GET'])
-@paginate('contests', 20)
+@query_guard.limit(6)
+@paginate('contests', 20, order=['-starts_at', '-id'], bulk=True)
 @auth.authenticate
 def list():
     """
@@ -332,6 +347,12 @@ def list():
         type: integer
         required: false
         description: Page number
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor of the page (from meta.next of the previous page), empty for the first one.
+                     Pages by cursor instead of page number
       - name: per_page
         in: query
         type: integer
@@ -362,37 +383,39 @@ def list():
                   description: Url for first page of results
                 last:
                   type: string
-                  description: Url for last page of results
+                  description: Url for last page of results (only when paging by number)
                 next:
                   type: string
                   description: Url for next page of results
                 prev:
                   type: string
-                  description: Url for previous page of results
+                  description: Url for previous page of results (only when paging by number)
                 page:
                   type: integer
-                  description: Number of the current page
+                  description: Number of the current page (only when paging by number)
                 pages:
                   type: integer
-                  description: All pages count
+                  description: All pages count (only when paging by number)
                 per_page:
                   type: integer
                   description: Item per each page
                 total:
                   type: integer
-                  description: Total count of all items
+                  description: Total count of all items (may lag a few seconds when paging by cursor)
       401:
         description: Token is invalid or has expired
     """
 
-    user_obj = User.objects.get(pk=g.user_id)
-    contests = Contest.objects.order_by('-starts_at')
-    result_func = lambda obj: Contest.to_json_user(obj, user_obj)
+    user_obj = g.user
+    contests = ContestRecord.query(Contest.objects.order_by('-starts_at'))
+    user_teams = Team.user_teams_abs(user_obj)
+    result_func = lambda contests: ContestRecord.to_json_list(ContestRecord.from_docs(contests), user_obj, user_teams)
     return contests, result_func
 
 
 @app.api_route('owner', methods=['GET'])
-@paginate('contests', 20)
+@query_guard.limit(3)
+@paginate('contests', 20, order=['-starts_at', '-id'], bulk=True)
 @auth.authenticate
 def list_owner():
     """
@@ -406,6 +429,12 @@ def list_owner():
         type: integer
         required: false
         description: Page number
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor of the page (from meta.next of the previous page), empty for the first one.
+                     Pages by cursor instead of page number
       - name: per_page
         in: query
         type: integer
@@ -463,6 +492,9 @@ def list_owner():
                     is_ended:
                       type: boolean
                       description: Contest is_ended
+                    fail_fast:
+                      type: boolean
+                      description: Contest fail_fast
                     pending_teams_num:
                       type: integer
                       description: Contest number of pending teams
@@ -473,9 +505,8 @@ def list_owner():
         description: Token is invalid or has expired
     """
 
-    user_obj = User.objects.get(pk=g.user_id)
-    contests = Contest.objects.filter(owner=user_obj).order_by('-starts_at')
-    result_func = lambda obj: Contest.to_json(obj)
+    contests = ContestRecord.query(Contest.objects.filter(owner=user_id()).order_by('-starts_at'))
+    result_func = lambda contests: ContestRecord.to_json_list(ContestRecord.from_docs(contests))
     return contests, result_func
 
 
@@ -568,23 +599,118 @@ def result(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
+        etag = make_etag('result', cid, g.user_id, obj.version, obj.stage, scoreboard.version(obj))
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
         now = utcnowts()
 
-        if not (user_obj == obj.owner or user_obj in obj.admins or \
-               (now >= obj.starts_at and obj.is_user_in_contest(user_obj)) or \
+        if not (is_contest_admin(obj) or \
+               (now >= obj.starts_at and is_contest_member(obj)) or \
                (now > obj.ends_at)):
             return abort(403, "You aren't allowed to see result")
 
-        return jsonify(obj.to_json_result()), 200
+        return etag_response(obj.to_json_result(), etag)
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest does not exist")
 
 
+@app.api_route('<string:cid>/result/stream', methods=['GET'])
+@auth.authenticate_stream
+def result_stream(cid):
+    """
+    Result Stream
+    ---
+    tags:
+      - contest
+    description: Server-sent events of the result. A `snapshot` event carries the whole
+                 result (same as Get Result), each `delta` event carries the new data and
+                 the rank of a single team. Event ids are the result versions.
+    produces:
+      - text/event-stream
+    parameters:
+      - name: cid
+        in: path
+        type: string
+        required: true
+        description: Id of contest
+      - name: access_token
+        in: query
+        type: string
+        required: true
+        description: Token of current user (or Access-Token header)
+      - name: version
+        in: query
+        type: integer
+        required: false
+        description: Resume after this version (or Last-Event-ID header),
+                     a snapshot is sent if the deltas aren't available anymore
+    responses:
+      200:
+        description: Stream of snapshot and delta events
+      401:
+        description: Token is invalid or has expired
+      403:
+        description: You aren't allowed to see result
+      404:
+        description: Contest does not exist
+    """
+
+    try:
+        obj = Contest.objects.get(pk=cid)
+        now = utcnowts()
+
+        if not (is_contest_admin(obj) or \
+               (now >= obj.starts_at and is_contest_member(obj)) or \
+               (now > obj.ends_at)):
+            return abort(403, "You aren't allowed to see result")
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "Contest does not exist")
+
+    since = request.headers.get('Last-Event-ID') or request.args.get('version')
+    since = int(since) if since and since.isdigit() else None
+    keepalive = app.config['SCOREBOARD_KEEPALIVE']
+
+    def snapshot():
+        version = scoreboard.version(obj)
+        return version, sse_event('snapshot', obj.to_json_result(), version)
+
+    def generate():
+        ## listens before reading the current state, so no delta is missed in between
+        with scoreboard.listen(cid) as events:
+            deltas = scoreboard.deltas_since(obj, since) if since is not None else None
+            if deltas is None:
+                version, event = snapshot()
+                yield event
+            else:
+                version = since
+                for delta in deltas:
+                    version = delta['version']
+                    yield sse_event('delta', delta, version)
+
+            while True:
+                try:
+                    delta = events.get(timeout=keepalive)
+                except Empty:
+                    yield sse_comment('keepalive')
+                    continue
+
+                if delta.get('reset'):
+                    obj.reload()
+                    version, event = snapshot()
+                    yield event
+                elif delta['version'] > version:
+                    version = delta['version']
+                    yield sse_event('delta', delta, version)
+
+    return sse_response(generate())
+
+
 ################################# Team #################################
 
 
 @app.api_route('team/<string:tid>', methods=['GET'])
+@query_guard.limit(5)
 @auth.authenticate
 def list_team(tid):
     """
@@ -628,10 +754,10 @@ def list_team(tid):
 
     try:
         obj = Team.objects.get(pk=tid)
-        wc = Contest.objects.filter(pending_teams=obj)
-        wc = [c.to_json() for c in wc]
-        jc = Contest.objects.filter(accepted_teams=obj)
-        jc = [c.to_json() for c in jc]
+        wc = ContestRecord.query(Contest.objects.filter(pending_teams=obj))
+        jc = ContestRecord.query(Contest.objects.filter(accepted_teams=obj))
+        wc = ContestRecord.to_json_list(ContestRecord.from_docs(wc))
+        jc = ContestRecord.to_json_list(ContestRecord.from_docs(jc))
 
         return jsonify(waiting_contests=wc, joined_contests=jc), 200
     except (db.DoesNotExist, db.ValidationError):
@@ -687,13 +813,13 @@ def team_join(cid):
         obj = Contest.objects.get(pk=cid)
         team_obj = Team.objects.get(pk=json['team_id'])
 
-        if str(team_obj.owner.pk) != g.user_id:
+        if not is_owner(team_obj):
             return abort(403, "You aren't owner of the team")
 
         if team_obj in obj.accepted_teams:
             return abort(409, "You are already accepted")
 
-        obj.update(add_to_set__pending_teams=team_obj)
+        obj.update(add_to_set__pending_teams=team_obj, inc__version=1)
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or Team does not exist")
@@ -740,16 +866,17 @@ def team_unjoin(cid, tid):
         team_obj = Team.objects.get(pk=tid)
         obj = Contest.objects.get(pk=cid, pending_teams=team_obj)
 
-        if str(team_obj.owner.pk) != g.user_id:
+        if not is_owner(team_obj):
             return abort(403, "You aren't owner of the team")
 
-        obj.update(pull__pending_teams=team_obj)
+        obj.update(pull__pending_teams=team_obj, inc__version=1)
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or Team does not exist")
 
 
 @app.api_route('<string:cid>/pending_teams', methods=['GET'])
+@query_guard.limit(3)
 @auth.authenticate
 def team_list_pending(cid):
     """
@@ -790,9 +917,8 @@ def team_list_pending(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         return jsonify(obj.to_json_teams('pending')), 200
@@ -801,6 +927,7 @@ def team_list_pending(cid):
 
 
 @app.api_route('<string:cid>/accepted_teams', methods=['GET'])
+@query_guard.limit(3)
 @auth.authenticate
 def team_list_accepted(cid):
     """
@@ -834,9 +961,8 @@ def team_list_accepted(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         return jsonify(obj.to_json_teams('accepted')), 200
@@ -882,12 +1008,11 @@ def team_accept(cid, tid):
     try:
         team_obj = Team.objects.get(pk=tid)
         obj = Contest.objects.get(pk=cid, pending_teams=team_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
-        obj.update(pull__pending_teams=team_obj, add_to_set__accepted_teams=team_obj)
+        obj.update(pull__pending_teams=team_obj, add_to_set__accepted_teams=team_obj, inc__version=1)
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or Team does not exist")
@@ -931,12 +1056,11 @@ def team_reject(cid, tid):
     try:
         team_obj = Team.objects.get(pk=tid)
         obj = Contest.objects.get(pk=cid, pending_teams=team_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
-        obj.update(pull__pending_teams=team_obj)
+        obj.update(pull__pending_teams=team_obj, inc__version=1)
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or Team does not exist")
@@ -980,12 +1104,11 @@ def team_kick(cid, tid):
     try:
         team_obj = Team.objects.get(pk=tid)
         obj = Contest.objects.get(pk=cid, accepted_teams=team_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
-        obj.update(pull__accepted_teams=team_obj)
+        obj.update(pull__accepted_teams=team_obj, inc__version=1)
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or Team does not exist")
@@ -1036,6 +1159,11 @@ def problem_create(cid):
               minimum: 16
               maximum: 256
               description: Problem space limit (mega bytes)
+            check_mode:
+              type: integer
+              minimum: 0
+              maximum: 3
+              description: Output check mode (0=Exact, 1=Trailing, 2=Token, 3=Float) (default is 1)
       - name: Access-Token
         in: header
         type: string
@@ -1061,9 +1189,8 @@ def problem_create(cid):
     json = request.json
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         if len(obj.problems) >= 20:
@@ -1072,7 +1199,7 @@ def problem_create(cid):
         problem_obj = Problem()
         problem_obj.populate(json)
         problem_obj.save()
-        obj.update(push__problems=problem_obj)
+        obj.update(push__problems=problem_obj, inc__version=1)
         return jsonify(problem_obj.to_json()), 201
 
     except (db.DoesNotExist, db.ValidationError):
@@ -1122,6 +1249,9 @@ def problem_info(cid, pid):
             space_limit:
               type: integer
               description: Problem space limit (mega bytes)
+            check_mode:
+              type: string
+              description: Output check mode
       401:
         description: Token is invalid or has expired
       403:
@@ -1133,11 +1263,10 @@ def problem_info(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
         now = utcnowts()
 
-        if not (user_obj == obj.owner or user_obj in obj.admins or \
-               (now >= obj.starts_at and obj.is_user_in_contest(user_obj)) or \
+        if not (is_contest_admin(obj) or \
+               (now >= obj.starts_at and is_contest_member(obj)) or \
                (now > obj.ends_at)):
             return abort(403, "You aren't allowed to see problem")
 
@@ -1147,6 +1276,7 @@ def problem_info(cid, pid):
 
 
 @app.api_route('<string:cid>/problem', methods=['GET'])
+@query_guard.limit(3)
 @auth.authenticate
 def problem_list(cid):
     """
@@ -1195,15 +1325,18 @@ def problem_list(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
+        etag = make_etag('problems', cid, g.user_id, obj.version, obj.stage)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
         now = utcnowts()
 
-        if not (user_obj == obj.owner or user_obj in obj.admins or \
-               (now >= obj.starts_at and obj.is_user_in_contest(user_obj)) or \
+        if not (is_contest_admin(obj) or \
+               (now >= obj.starts_at and is_contest_member(obj)) or \
                (now > obj.ends_at)):
             return abort(403, "You aren't allowed to see problems")
 
-        return jsonify(obj.to_json_problems()), 200
+        return etag_response(obj.to_json_problems(), etag)
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest does not exist")
 
@@ -1250,6 +1383,11 @@ def problem_edit(cid, pid):
               minimum: 16
               maximum: 256
               description: Problem space limit (mega bytes)
+            check_mode:
+              type: integer
+              minimum: 0
+              maximum: 3
+              description: Output check mode (0=Exact, 1=Trailing, 2=Token, 3=Float) (default is 1)
       - name: Access-Token
         in: header
         type: string
@@ -1274,13 +1412,13 @@ def problem_edit(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         problem_obj.populate(json)
         problem_obj.save()
+        obj.update(inc__version=1)
         return jsonify(problem_obj.to_json()), 200
 
     except (db.DoesNotExist, db.ValidationError):
@@ -1341,9 +1479,8 @@ def problem_change_order(cid):
     json = request.json
     try:
         obj = Contest.objects.get(pk=cid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         if len(list(set(json['order']))) != len(json['order']) or \
@@ -1403,12 +1540,12 @@ def problem_delete(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         problem_obj.delete()
+        obj.update(inc__version=1)
         obj.reload()
         return jsonify(obj.to_json_problems()), 200
     except (db.DoesNotExist, db.ValidationError):
@@ -1464,9 +1601,8 @@ def problem_upload_body(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         form = UploadProblemBody()
@@ -1533,9 +1669,8 @@ def problem_upload_testcase(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if (user_obj != obj.owner) and (not user_obj in obj.admins):
+        if not is_contest_admin(obj):
             return abort(403, "You aren't owner or admin of the contest")
 
         form = UploadTestCase()
@@ -1545,13 +1680,7 @@ def problem_upload_testcase(cid, pid):
         if not form.validate_file():
             return abort(415, "Supported file type is only application/zip")
 
-        if os.path.exists(problem_obj.testcase_dir):
-            shutil.rmtree(problem_obj.testcase_dir)
-
-        file_obj = form.testcase.data
-        with zipfile.ZipFile(file_obj) as zf:
-            zf.extractall(problem_obj.testcase_dir)
-
+        problem_obj.update_testcases(form.testcase.data)
         return "", 200
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Contest or problem does not exist")
@@ -1595,11 +1724,10 @@ def problem_download_body(cid, pid):
     try:
         problem_obj = Problem.objects.get(pk=pid)
         obj = Contest.objects.get(pk=cid, problems=problem_obj)
-        user_obj = User.objects.get(pk=g.user_id)
         now = utcnowts()
 
-        if not (user_obj == obj.owner or user_obj in obj.admins or \
-               (now >= obj.starts_at and obj.is_user_in_contest(user_obj)) or \
+        if not (is_contest_admin(obj) or \
+               (now >= obj.starts_at and is_contest_member(obj)) or \
                (now > obj.ends_at)):
             return abort(403, "You aren't allowed to see problem body")
 
@@ -1665,12 +1793,12 @@ def admin_add(cid):
     json = request.json
     try:
         obj = Contest.objects.get(pk=cid)
-        if str(obj.owner.pk) != g.user_id:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the contest")
 
         user_obj = User.objects.get(username=json['username'])
-        if user_obj != obj.owner:
-            obj.update(add_to_set__admins=user_obj)
+        if user_obj.pk != field_id(obj, 'owner'):
+            obj.update(add_to_set__admins=user_obj, inc__version=1)
         obj.reload()
 
         return jsonify(obj.to_json_admins()), 201
@@ -1719,12 +1847,12 @@ def admin_remove(cid, uid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        if str(obj.owner.pk) != g.user_id:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the contest")
 
         user_obj = User.objects.get(pk=uid)
 
-        obj.update(pull__admins=user_obj)
+        obj.update(pull__admins=user_obj, inc__version=1)
         obj.reload()
         return jsonify(obj.to_json_admins()), 200
 
@@ -1733,6 +1861,7 @@ def admin_remove(cid, uid):
 
 
 @app.api_route('<string:cid>/admin', methods=['GET'])
+@query_guard.limit(2)
 @auth.authenticate
 def admin_list(cid):
     """
@@ -1772,7 +1901,7 @@ def admin_list(cid):
 
     try:
         obj = Contest.objects.get(pk=cid)
-        if str(obj.owner.pk) != g.user_id:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the contest")
 
         return jsonify(obj.to_json_admins()), 200
@@ -1781,7 +1910,8 @@ def admin_list(cid):
 
 
 @app.api_route('admin', methods=['GET'])
-@paginate('contests', 20)
+@query_guard.limit(3)
+@paginate('contests', 20, order=['-starts_at', '-id'], bulk=True)
 @auth.authenticate
 def admin_contests():
     """
@@ -1795,6 +1925,12 @@ def admin_contests():
         type: integer
         required: false
         description: Page number
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor of the page (from meta.next of the previous page), empty for the first one.
+                     Pages by cursor instead of page number
       - name: per_page
         in: query
         type: integer
@@ -1814,7 +1950,6 @@ def admin_contests():
         description: Token is invalid or has expired
     """
 
-    user_obj = User.objects.get(pk=g.user_id)
-    contests = Contest.objects.filter(admins=user_obj).order_by('-starts_at')
-    result_func = lambda obj: Contest.to_json(obj)
+    contests = ContestRecord.query(Contest.objects.filter(admins=user_id()).order_by('-starts_at'))
+    result_func = lambda contests: ContestRecord.to_json_list(ContestRecord.from_docs(contests))
     return contests, result_func
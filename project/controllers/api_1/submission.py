@@ -3,21 +3,27 @@ __author__ = 'AminHP'
 
 # python imports
 import os
+import time
+import uuid
 
 # flask imports
-from flask import jsonify, request, g, send_file, abort
+from flask import jsonify, request, g, send_file, abort, url_for
+from celery.signals import worker_process_init, worker_process_shutdown
 
 # project imports
 from project import app
-from project.extensions import db, auth
+from project.extensions import db, auth, redis, query_guard
 from project.modules.datetime import utcnowts
+from project.modules.paginator import keyset_page
+from project.modules.loader import field_ids
+from project.modules.permissions import is_contest_admin, is_team_member
 from project.modules import ijudge
 from project.models.submission import Submission, JudgementStatusType
 from project.models.contest import Problem, Contest
 from project.models.team import Team
-from project.models.user import User
+from project.models.records import SubmissionRecord
 from project.forms.submission import UploadCode
-from project.extensions import celery
+from project.extensions import celery, verdict_cache, judge_queues, judge_scheduler, scoreboard, verdict_notifier
 
 
 @app.api_route('', methods=['POST'])
@@ -91,17 +97,17 @@ def create():
         json = form.to_json()
         tid = json['team_id']
 
-        user_obj = User.objects.get(pk=g.user_id)
+        user_obj = g.user
         problem_obj = Problem.objects.get(pk=json['problem_id'])
 
         if not tid:
             contest_obj = Contest.objects.get(pk=json['contest_id'], problems=problem_obj)
-            if (user_obj != contest_obj.owner) and (not user_obj in contest_obj.admins):
+            if not is_contest_admin(contest_obj):
                 return abort(403, "You aren't owner or admin of the contest")
         else:
             team_obj = Team.objects.get(pk=tid)
             contest_obj = Contest.objects.get(pk=json['contest_id'], problems=problem_obj, accepted_teams=team_obj)
-            if not team_obj.is_user_in_team(user_obj):
+            if not is_team_member(team_obj):
                 return abort(403, "You aren't owner or member of the team")
 
             now = utcnowts()
@@ -130,7 +136,14 @@ def create():
             os.makedirs(directory)
         file_obj.save(obj.code_path)
 
-        check_code_task.delay(str(obj.pk), False if tid else True)
+        ## byte-identical work which is already judged doesn't go to the queue
+        key = verdict_cache.make_key(obj.code_path, obj.prog_lang, problem_obj)
+        verdict = verdict_cache.get(key, JudgementStatusType)
+        test = False if tid else True
+        if verdict:
+            save_verdict(obj, verdict[0], verdict[1], test)
+        else:
+            queue_submission(obj, judge_queues.route(test))
 
         return "", 201
     except (db.DoesNotExist, db.ValidationError):
@@ -139,6 +152,7 @@ def create():
 
 @app.api_route('contest/<string:cid>', methods=['GET'])
 @app.api_route('contest/<string:cid>/team/<string:tid>', methods=['GET'])
+@query_guard.limit(5)
 @auth.authenticate
 def list(cid, tid=None):
     """
@@ -157,14 +171,34 @@ def list(cid, tid=None):
         type: string
         required: false
         description: Id of team
+      - name: problem_id
+        in: query
+        type: string
+        required: false
+        description: Only submissions of this problem
       - name: Access-Token
         in: header
         type: string
         required: true
         description: Token of current user
+      - name: status
+        in: query
+        type: integer
+        required: false
+        description: Only submissions with this status (value of the status)
+      - name: per_page
+        in: query
+        type: integer
+        required: false
+        description: Submissions per page (max 100)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor of the page (from meta.next of the previous page)
     responses:
       200:
-        description: Submissions list
+        description: Submissions list (newest first)
         schema:
           id: SubmissionList
           type: object
@@ -194,6 +228,15 @@ def list(cid, tid=None):
             reason:
               type: string
               description: Error reason (is null when status is Pending or Accepted)
+            meta:
+              type: object
+              description: (in the response root, next to the submissions list)
+              properties:
+                per_page:
+                  type: integer
+                next:
+                  type: string
+                  description: Url of the next page (is null on the last page)
       400:
         description: Bad request
       401:
@@ -206,24 +249,25 @@ def list(cid, tid=None):
     """
 
     try:
-        user_obj = User.objects.get(pk=g.user_id)
         if not tid:
             contest_obj = Contest.objects.get(pk=cid)
-            if (user_obj != contest_obj.owner) and (not user_obj in contest_obj.admins):
+            if not is_contest_admin(contest_obj):
                 return abort(403, "You aren't owner or admin of the contest")
         else:
             team_obj = Team.objects.get(pk=tid)
             contest_obj = Contest.objects.get(pk=cid, accepted_teams=team_obj)
-            if not team_obj.is_user_in_team(user_obj):
+            if not is_team_member(team_obj):
                 return abort(403, "You aren't owner or member of the team")
 
         submissions = Submission.objects.filter(
             contest = contest_obj,
             team = team_obj if tid else None
-        ).order_by('-submitted_at')
+        )
+        problem_id = request.args.get('problem_id')
+        if problem_id:
+            submissions = submissions.filter(problem=problem_id)
 
-        submissions = [s.to_json() for s in submissions]
-        return jsonify(submissions=submissions), 200
+        return submissions_page(submissions, dict(cid=cid, tid=tid, problem_id=problem_id))
 
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Team or contest does not exist")
@@ -231,6 +275,7 @@ def list(cid, tid=None):
 
 @app.api_route('contest/<string:cid>/problem/<string:pid>', methods=['GET'])
 @app.api_route('contest/<string:cid>/problem/<string:pid>/team/<string:tid>', methods=['GET'])
+@query_guard.limit(6)
 @auth.authenticate
 def list_problem(cid, pid, tid=None):
     """
@@ -259,9 +304,24 @@ def list_problem(cid, pid, tid=None):
         type: string
         required: true
         description: Token of current user
+      - name: status
+        in: query
+        type: integer
+        required: false
+        description: Only submissions with this status (value of the status)
+      - name: per_page
+        in: query
+        type: integer
+        required: false
+        description: Submissions per page (max 100)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Cursor of the page (from meta.next of the previous page)
     responses:
       200:
-        description: Submissions list
+        description: Submissions list (newest first)
         schema:
           $ref: "#/definitions/api_1_submission_list_get_SubmissionList"
       400:
@@ -276,27 +336,24 @@ def list_problem(cid, pid, tid=None):
     """
 
     try:
-        user_obj = User.objects.get(pk=g.user_id)
         problem_obj = Problem.objects.get(pk=pid)
 
         if not tid:
             contest_obj = Contest.objects.get(pk=cid, problems=problem_obj)
-            if (user_obj != contest_obj.owner) and (not user_obj in contest_obj.admins):
+            if not is_contest_admin(contest_obj):
                 return abort(403, "You aren't owner or admin of the contest")
         else:
             team_obj = Team.objects.get(pk=tid)
             contest_obj = Contest.objects.get(pk=cid, problems=problem_obj, accepted_teams=team_obj)
-            if not team_obj.is_user_in_team(user_obj):
+            if not is_team_member(team_obj):
                 return abort(403, "You aren't owner or member of the team")
 
         submissions = Submission.objects.filter(
             contest = contest_obj,
             problem = problem_obj,
             team = team_obj if tid else None
-        ).order_by('-submitted_at')
-
-        submissions = [s.to_json() for s in submissions]
-        return jsonify(submissions=submissions), 200
+        )
+        return submissions_page(submissions, dict(cid=cid, pid=pid, tid=tid))
 
     except (db.DoesNotExist, db.ValidationError):
         return abort(404, "Team or contest or problem does not exist")
@@ -335,13 +392,12 @@ def download_code(sid):
 
     try:
         obj = Submission.objects.get(pk=sid)
-        user_obj = User.objects.get(pk=g.user_id)
 
         if not obj.team:
-            if (user_obj != obj.contest.owner) and (not user_obj in obj.contest.admins):
+            if not is_contest_admin(obj.contest):
                 return abort(403, "You aren't owner or admin of the contest")
         else:
-            if not obj.team.is_user_in_team(user_obj):
+            if not is_team_member(obj.team):
                 return abort(403, "You aren't owner or member of the team")
 
         return send_file(obj.code_path)
@@ -350,32 +406,512 @@ def download_code(sid):
 
 
 
+@app.api_route('<string:sid>/queue', methods=['GET'])
+@auth.authenticate
+def queue_info(sid):
+    """
+    Get Queue Position of a Pending Submission
+    ---
+    tags:
+      - submission
+    parameters:
+      - name: sid
+        in: path
+        type: string
+        required: true
+        description: Id of submission
+      - name: Access-Token
+        in: header
+        type: string
+        required: true
+        description: Token of current user
+    responses:
+      200:
+        description: Queue position
+        schema:
+          id: SubmissionQueueInfo
+          type: object
+          properties:
+            position:
+              type: integer
+              description: Estimated number of submissions which will be judged before this one
+            expected_wait:
+              type: number
+              description: Estimated seconds until the verdict (is null when there is no estimate yet)
+      401:
+        description: Token is invalid or has expired
+      403:
+        description: (You aren't owner or member of the team)
+                     (You aren't owner or admin of the contest)
+      404:
+        description: Submission does not exist
+      406:
+        description: Submission is not in the judge queue
+    """
+
+    try:
+        obj = Submission.objects.get(pk=sid)
+
+        if not obj.team:
+            if not is_contest_admin(obj.contest):
+                return abort(403, "You aren't owner or admin of the contest")
+        else:
+            if not is_team_member(obj.team):
+                return abort(403, "You aren't owner or member of the team")
+
+        queue = judge_scheduler.queue_of(obj)
+        position = judge_scheduler.position(queue, obj) if queue else None
+        if position is None:
+            return abort(406, "Submission is not in the judge queue")
+
+        expected_wait = judge_scheduler.expected_wait(queue, position, judge_queues.slots(queue))
+        return jsonify(position=position, expected_wait=expected_wait), 200
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "Submission does not exist")
+
+
+@app.api_route('contest/<string:cid>/team/<string:tid>/verdicts', methods=['GET'])
+@auth.authenticate
+def poll_verdicts(cid, tid):
+    """
+    Wait For New Verdicts of The Team
+    ---
+    tags:
+      - submission
+    description: Blocks until a submission of the team gets a verdict after `seq`
+                 or the timeout passes. Without `seq` it returns the current sequence
+                 immediately, which is used for the next poll.
+    parameters:
+      - name: cid
+        in: path
+        type: string
+        required: true
+        description: Id of contest
+      - name: tid
+        in: path
+        type: string
+        required: true
+        description: Id of team
+      - name: seq
+        in: query
+        type: integer
+        required: false
+        description: Sequence of the last received verdict
+      - name: timeout
+        in: query
+        type: integer
+        required: false
+        description: Longest wait in seconds (default and maximum are set in the config)
+      - name: Access-Token
+        in: header
+        type: string
+        required: true
+        description: Token of current user
+    responses:
+      200:
+        description: Verdicts after seq
+        schema:
+          id: SubmissionVerdicts
+          type: object
+          properties:
+            seq:
+              type: integer
+              description: Sequence of the last verdict, is sent back in the next poll
+            verdicts:
+              type: array
+              description: Changed submissions (is null when some verdicts are missed
+                           and the submissions list should be loaded again)
+              items:
+                schema:
+                  properties:
+                    id:
+                      type: string
+                      description: Submission id
+                    problem:
+                      type: string
+                      description: Problem id
+                    submitted_at:
+                      type: integer
+                      description: Submission submitted_at (utc timestamp)
+                    status:
+                      type: string
+                      description: Submission status
+                    reason:
+                      type: string
+                      description: Error reason (is null when status is Pending or Accepted)
+                    seq:
+                      type: integer
+      401:
+        description: Token is invalid or has expired
+      403:
+        description: You aren't owner or member of the team
+      404:
+        description: Team or contest does not exist
+    """
+
+    try:
+        team_obj = Team.objects.get(pk=tid)
+        contest_obj = Contest.objects.only('id').get(pk=cid, accepted_teams=team_obj)
+        if not is_team_member(team_obj):
+            return abort(403, "You aren't owner or member of the team")
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "Team or contest does not exist")
+
+    cid, tid = str(contest_obj.pk), str(team_obj.pk)
+    seq = request.args.get('seq', type=int)
+    if seq is None:
+        return jsonify(seq=verdict_notifier.seq(cid, tid), verdicts=[]), 200
+
+    timeout = request.args.get('timeout', verdict_notifier.timeout, type=int)
+    timeout = max(0, min(timeout, verdict_notifier.timeout))
+    verdicts, seq = verdict_notifier.wait(cid, tid, seq, timeout)
+    return jsonify(seq=seq, verdicts=verdicts), 200
+
+
+
+@app.api_route('rejudge', methods=['POST'])
+@app.api_validate('submission.rejudge_schema')
+@auth.authenticate
+def rejudge():
+    """
+    Rejudge Submissions
+    ---
+    tags:
+      - submission
+    parameters:
+      - name: body
+        in: body
+        description: Filter of the submissions (pending and test submissions aren't rejudged)
+        required: true
+        schema:
+          id: SubmissionRejudge
+          required:
+            - contest_id
+          properties:
+            contest_id:
+              type: string
+            problem_id:
+              type: string
+            team_id:
+              type: string
+            status:
+              type: integer
+              description: Only rejudge submissions with this status (1=Accepted, 2=CompileError, ...)
+      - name: Access-Token
+        in: header
+        type: string
+        required: true
+        description: Token of current user
+    responses:
+      202:
+        description: Rejudge job is queued
+        schema:
+          id: RejudgeJobInfo
+          type: object
+          properties:
+            id:
+              type: string
+              description: Job id
+            total:
+              type: integer
+              description: Number of submissions
+            done:
+              type: integer
+              description: Number of rejudged submissions
+            finished:
+              type: boolean
+              description: Is true when the submissions are rejudged and the result is recomputed
+      400:
+        description: Bad request
+      401:
+        description: Token is invalid or has expired
+      403:
+        description: You aren't owner or admin of the contest
+      404:
+        description: Contest or problem or team does not exist
+    """
+
+    json = request.json
+    try:
+        contest_obj = Contest.objects.get(pk=json['contest_id'])
+        if not is_contest_admin(contest_obj):
+            return abort(403, "You aren't owner or admin of the contest")
+
+        query = dict(
+            contest = contest_obj,
+            team__ne = None,
+            status__ne = JudgementStatusType.Pending
+        )
+        if 'problem_id' in json:
+            query['problem'] = Problem.objects.get(pk=json['problem_id'])
+            if query['problem'].pk not in field_ids(contest_obj, 'problems'):
+                return abort(404, "Contest or problem or team does not exist")
+        if 'team_id' in json:
+            query['team'] = Team.objects.get(pk=json['team_id'])
+        if 'status' in json:
+            query['status'] = JudgementStatusType(json['status'])
+
+        sids = [str(s['_id']) for s in Submission.objects(**query).order_by('submitted_at').only('id').as_pymongo()]
+        job_id = uuid.uuid4().hex
+        key = rejudge_job_key(job_id)
+        redis.hmset(key, dict(
+            contest = str(contest_obj.pk),
+            total = len(sids),
+            done = 0,
+            started_at = time.time(),
+            finished = 0 if sids else 1
+        ))
+        redis.expire(key, app.config['JUDGE_REJUDGE_JOB_TIMEOUT'])
+
+        batch_size = app.config['JUDGE_REJUDGE_BATCH_SIZE']
+        for i in range(0, len(sids), batch_size):
+            rejudge_task.apply_async(args=[job_id, sids[i:i + batch_size]], queue=judge_queues.rejudge)
+
+        return jsonify(rejudge_job_to_json(job_id)), 202
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "Contest or problem or team does not exist")
+
+
+@app.api_route('rejudge/<string:job_id>', methods=['GET'])
+@auth.authenticate
+def rejudge_info(job_id):
+    """
+    Get Rejudge Job Progress
+    ---
+    tags:
+      - submission
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+        description: Id of rejudge job
+      - name: Access-Token
+        in: header
+        type: string
+        required: true
+        description: Token of current user
+    responses:
+      200:
+        description: Rejudge job progress
+        schema:
+          $ref: "#/definitions/api_1_submission_rejudge_post_RejudgeJobInfo"
+      401:
+        description: Token is invalid or has expired
+      403:
+        description: You aren't owner or admin of the contest
+      404:
+        description: Rejudge job does not exist
+    """
+
+    try:
+        cid = redis.hget(rejudge_job_key(job_id), 'contest')
+        if cid is None:
+            return abort(404, "Rejudge job does not exist")
+
+        contest_obj = Contest.objects.get(pk=cid)
+        if not is_contest_admin(contest_obj):
+            return abort(403, "You aren't owner or admin of the contest")
+
+        return jsonify(rejudge_job_to_json(job_id)), 200
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "Rejudge job does not exist")
+
+
+
+def submissions_page(submissions, url_args):
+    status = request.args.get('status', type=int)
+    if status is not None:
+        if status not in [s.value for s in JudgementStatusType]:
+            return abort(400, "Status is invalid")
+        submissions = submissions.filter(status=status)
+
+    per_page = max(1, min(request.args.get('per_page', app.config['DEFAULT_PAGE_SIZE'], type=int), 100))
+    submissions = SubmissionRecord.query(submissions)
+    items, cursor = keyset_page(submissions, ['-submitted_at', '-id'], per_page, request.args.get('cursor'))
+
+    next_url = None
+    if cursor:
+        url_args.update(status=status)
+        url_args = dict((k, v) for k, v in url_args.items() if v is not None)
+        next_url = url_for(request.endpoint, cursor=cursor, per_page=per_page, _external=True, **url_args)
+
+    return jsonify(
+        submissions = SubmissionRecord.to_json_list(SubmissionRecord.from_docs(items)),
+        meta = dict(per_page=per_page, next=next_url)
+    ), 200
+
+
+@worker_process_init.connect
+def startup_judge_backend(**kwargs):
+    ijudge.get_backend().startup()
+
+
+@worker_process_shutdown.connect
+def shutdown_judge_backend(**kwargs):
+    ijudge.get_backend().shutdown()
+
+
+def queue_submission(obj, queue):
+    judge_scheduler.push(queue, obj)
+    judge_next_task.apply_async(args=[queue], queue=queue)
+
+
+def requeue_submission(queue, sid):
+    try:
+        obj = Submission.objects.get(pk=sid)
+    except (db.DoesNotExist, db.ValidationError):
+        judge_scheduler.ack(queue, sid)
+        return
+
+    if judge_scheduler.attempts(queue, sid) >= app.config['JUDGE_TASK_ATTEMPTS']:
+        ## a final status, so it doesn't count as pending and can be rejudged
+        judge_scheduler.ack(queue, sid)
+        obj.status = JudgementStatusType.JudgeError
+        obj.reason = "Judge failed %s times" % app.config['JUDGE_TASK_ATTEMPTS']
+        obj.save()
+        if obj.team:
+            verdict_notifier.publish(obj)
+        return
+    queue_submission(obj, queue)
+
+
+def requeue_expired(queue):
+    ## submissions of the workers which died while judging are queued again
+    for sid in judge_scheduler.expired(queue):
+        requeue_submission(queue, sid)
+
+
 @celery.task()
-def check_code_task(sid, test):
-    obj = Submission.objects.get(pk=sid)
-    check_code(obj, test)
+def reap_judge_queue_task(queue):
+    requeue_expired(queue)
+
+
+@celery.task()
+def judge_next_task(queue):
+    requeue_expired(queue)
+
+    ## the task is a token, the scheduler picks the submission fairly when a worker is free
+    lease = app.config['JUDGE_TASK_LEASE']
+    sid = judge_scheduler.pop(queue, lease)
+    if sid is None:
+        return
+    ## the lease is checked after it ends even if nothing else is submitted
+    reap_judge_queue_task.apply_async(args=[queue], queue=queue, countdown=lease + 1)
+
+    try:
+        obj = Submission.objects.get(pk=sid)
+    except (db.DoesNotExist, db.ValidationError):
+        judge_scheduler.ack(queue, sid)
+        return
+
+    started_at = time.time()
+    try:
+        check_code(obj, obj.team is None)
+    except Exception:
+        app.logger.exception("Judging submission %s failed", sid)
+        if judge_scheduler.release(queue, sid):
+            requeue_submission(queue, sid)
+        return
+    judge_scheduler.ack(queue, sid)
+    judge_scheduler.record_time(queue, time.time() - started_at)
+
+
+@celery.task()
+def rejudge_task(job_id, sids):
+    key = rejudge_job_key(job_id)
+    started_at = float(redis.hget(key, 'started_at') or 0)
+
+    for sid in sids:
+        try:
+            obj = Submission.objects.get(pk=sid)
+            ## identical codes in the job are judged once, verdicts from before the job are ignored
+            obj.status, obj.reason = judge_code(obj, since=started_at)
+            obj.save()
+            if obj.team:
+                verdict_notifier.publish(obj)
+        except (db.DoesNotExist, db.ValidationError):
+            pass
+        except Exception:
+            ## one broken submission doesn't stop the job, it keeps its previous verdict
+            app.logger.exception("Rejudging submission %s of job %s failed", sid, job_id)
+            Submission.objects(pk=sid).update(set__reason="Rejudge failed, the verdict is from before the rejudge")
+        finally:
+            done = redis.hincrby(key, 'done', 1)
+
+    ## the last batch recomputes the result once for the whole job
+    if done >= int(redis.hget(key, 'total') or 0):
+        contest_obj = Contest.objects.get(pk=redis.hget(key, 'contest'))
+        submissions = Submission.objects(
+            contest = contest_obj,
+            team__ne = None,
+            status__nin = [JudgementStatusType.Pending, JudgementStatusType.JudgeError]
+        )
+        contest_obj.result.recompute(contest_obj, submissions)
+        redis.hset(key, 'finished', 1)
+
+
+def rejudge_job_key(job_id):
+    return "rejudge:%s" % job_id
+
+
+def rejudge_job_to_json(job_id):
+    job = redis.hgetall(rejudge_job_key(job_id))
+    return dict(
+        id = job_id,
+        total = int(job['total']),
+        done = int(job['done']),
+        finished = job['finished'] == '1'
+    )
 
 
 def check_code(obj, test):
+    status, reason = judge_code(obj)
+    save_verdict(obj, status, reason, test)
+
+
+def judge_code(obj, since=None):
+    key = verdict_cache.make_key(obj.code_path, obj.prog_lang, obj.problem)
+    verdict = verdict_cache.get(key, JudgementStatusType, since)
+    if verdict:
+        return verdict
+
     status, reason = ijudge.judge(
         obj.code_path,
         obj.prog_lang,
         obj.problem.testcase_dir,
         obj.problem.time_limit,
-        obj.problem.space_limit
+        obj.problem.space_limit,
+        obj.contest.fail_fast,
+        obj.problem.check_mode
     )
+    verdict_cache.set(key, status, reason)
+    return status, reason
+
+
+def save_verdict(obj, status, reason, test):
     obj.status = status
     obj.reason = reason
     obj.save()
     if not test:
+        verdict_notifier.publish(obj)
         update_contest_result(obj)
 
 
 def update_contest_result(obj):
-    result = obj.contest.result
-    tid = str(obj.team.pk)
-    pid = str(obj.problem.pk)
-    if obj.status == JudgementStatusType.Accepted:
-        result.update_succeed_try(tid, pid, obj.submitted_at, obj.contest.starts_at)
-    else:
-        result.update_failed_try(tid, pid, obj.submitted_at)
+    contest_obj = obj.contest
+    accepted = obj.status == JudgementStatusType.Accepted
+    scoreboard.update(contest_obj, str(obj.pk), str(obj.team.pk), str(obj.problem.pk), accepted, obj.submitted_at)
+
+    cid = str(contest_obj.pk)
+    if scoreboard.claim_persist(cid):
+        persist_result_task.apply_async(args=[cid], queue=judge_queues.contest, countdown=scoreboard.persist_delay)
+
+
+@celery.task()
+def persist_result_task(cid):
+    ## released before loading, so a verdict after this point schedules the next persist
+    scoreboard.release_persist(cid)
+    contest_obj = Contest.objects.get(pk=cid)
+    teams, sorted_team_ids, _ = scoreboard.load(contest_obj)
+    contest_obj.result.persist(teams, sorted_team_ids)
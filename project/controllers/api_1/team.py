@@ -6,9 +6,10 @@ from flask import jsonify, request, g, abort
 
 # project imports
 from project import app
-from project.extensions import db, auth
+from project.extensions import db, auth, query_guard
+from project.modules.permissions import is_owner
+from project.modules.loader import field_ids
 from project.models.team import Team
-from project.models.user import User
 from project.models.contest import Contest
 
 
@@ -67,7 +68,7 @@ def create():
 
     json = request.json
     try:
-        owner = User.objects.get(pk=g.user_id)
+        owner = g.user
         my_teams = Team.teams(owner)
         if len(my_teams['owner_teams']) >= 5:
             return abort(406, "You can't create more teams")
@@ -76,6 +77,7 @@ def create():
         obj.owner = owner
         obj.populate(json)
         obj.save()
+        obj.touch()
         return jsonify(obj.to_json()), 201
 
     except db.NotUniqueError:
@@ -204,11 +206,14 @@ def edit(tid):
     json = request.json
     try:
         obj = Team.objects.get(pk=tid)
-        if str(obj.owner.pk) != g.user_id:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the team")
 
+        members = field_ids(obj, 'members')
         obj.populate(json)
         obj.save()
+        obj.touch(members)
+        Contest.objects(db.Q(pending_teams=obj) | db.Q(accepted_teams=obj)).update(inc__version=1)
         return jsonify(obj.to_json()), 200
 
     except db.NotUniqueError:
@@ -219,6 +224,7 @@ def edit(tid):
 
 
 @app.api_route('', methods=['GET'])
+@query_guard.limit(4)
 @auth.authenticate
 def list():
     """
@@ -253,7 +259,7 @@ def list():
         description: Token is invalid or has expired
     """
 
-    user_obj = User.objects.get(pk=g.user_id)
+    user_obj = g.user
     teams = Team.teams(user_obj)
     return jsonify(teams), 200
 
@@ -292,14 +298,15 @@ def delete(tid):
 
     try:
         obj = Team.objects.get(pk=tid)
-        user_obj = User.objects.get(pk=g.user_id)
 
-        if user_obj != obj.owner:
+        if not is_owner(obj):
             return abort(403, "You aren't owner of the team")
 
         if Contest.objects(accepted_teams=obj).count() > 0:
             return abort(406, "The team has participated in a number of contests")
 
+        Contest.objects(pending_teams=obj).update(inc__version=1)
+        obj.touch()
         obj.delete()
         return '', 200
     except (db.DoesNotExist, db.ValidationError):
@@ -122,7 +122,7 @@ def login():
             obj = User.objects.get(username=login)
 
         if obj.verify_password(password):
-            token = auth.generate_token(obj.pk)
+            token = auth.generate_token(obj)
             return jsonify(token=token), 200
         else:
             return abort(406, "Wrong password")
@@ -180,6 +180,32 @@ def logout():
     return '', 200
 
 
+@app.api_route('logout_all', methods=['POST'])
+@auth.authenticate
+def logout_all():
+    """
+    Logout Everywhere
+    ---
+    tags:
+      - user
+    description: Expires all tokens of the current user
+    parameters:
+      - name: Access-Token
+        in: header
+        type: string
+        required: true
+        description: Token of current user
+    responses:
+      200:
+        description: Successfully logged out
+      401:
+        description: Token is invalid or has expired
+    """
+
+    auth.expire_all_tokens(g.user_id)
+    return '', 200
+
+
 @app.api_route('<string:uid>', methods=['GET'])
 @auth.authenticate
 def info(uid):
@@ -259,7 +285,10 @@ def myinfo():
         description: User does not exist
     """
 
-    return info(uid=g.user_id)
+    try:
+        return jsonify(g.user.to_json()), 200
+    except (db.DoesNotExist, db.ValidationError):
+        return abort(404, "User does not exist")
 
 
 @app.api_route('', methods=['PUT'])
@@ -324,7 +353,7 @@ def edit():
 
     json = request.json
     try:
-        obj = User.objects.get(pk=g.user_id)
+        obj = g.user
         obj.populate(json)
         if 'password' in json:
             old_password = json['password']['old_password']
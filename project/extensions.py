@@ -14,6 +14,13 @@ from project.modules.api_router import ApiRouter
 from project.modules.api_doc import ApiDoc
 from project.modules.auth import Auth
 from project.modules.recaptcha import ReCaptcha
+from project.modules.verdict_cache import VerdictCache
+from project.modules.judge_queues import JudgeQueues
+from project.modules.judge_scheduler import JudgeScheduler
+from project.modules.scoreboard import Scoreboard
+from project.modules.verdict_notifier import VerdictNotifier
+from project.modules.query_guard import QueryGuard
+from project.modules.ijudge import container_pool, local_runner, compile_cache
 
 
 cache = Cache()
@@ -25,4 +32,10 @@ validator = Validator()
 api_router = ApiRouter()
 api_doc = ApiDoc()
 auth = Auth(redis)
+verdict_cache = VerdictCache(redis)
+judge_queues = JudgeQueues()
+judge_scheduler = JudgeScheduler(redis)
+scoreboard = Scoreboard(redis)
+verdict_notifier = VerdictNotifier(redis)
+query_guard = QueryGuard()
 recaptcha = ReCaptcha()
@@ -4,19 +4,27 @@ __author__ = 'AminHP'
 # python imports
 import os
 import shutil
+import zipfile
 
 # project imports
 from project import app
-from project.extensions import db
+from project.extensions import db, cache, scoreboard
 from project.modules.datetime import utcnowts
+from project.modules.fields import IntEnumField
+from project.modules.loader import Loader, field_id, field_ids
+from project.modules import ijudge
+from project.modules.ijudge.types import CheckModeType, JudgementStatusType
 from project.models.user import User
 from project.models.team import Team
+from project.models.records import UserAbsRecord, ProblemAbsRecord, TeamNameRecord, TeamRecord, SubmissionRecord
 
 
 class Problem(db.Document):
     title = db.StringField(required=True)
     time_limit = db.FloatField(required=True)
     space_limit = db.IntField(required=True)
+    check_mode = IntEnumField(enum=CheckModeType, default=CheckModeType.Trailing)
+    testcase_version = db.StringField()
 
     meta = {
         'collection': 'problems'
@@ -39,6 +47,18 @@ class Problem(db.Document):
         super(Problem, self).delete(*args, **kwargs)
 
 
+    def update_testcases(self, file_obj):
+        if os.path.exists(self.testcase_dir):
+            shutil.rmtree(self.testcase_dir)
+
+        with zipfile.ZipFile(file_obj) as zf:
+            zf.extractall(self.testcase_dir)
+
+        manifest = ijudge.build_manifest(self.testcase_dir)
+        self.testcase_version = manifest['version']
+        self.update(set__testcase_version=self.testcase_version)
+
+
     def populate(self, json):
         if 'title' in json:
             self.title = json['title']
@@ -46,6 +66,8 @@ class Problem(db.Document):
             self.time_limit = json['time_limit']
         if 'space_limit' in json:
             self.space_limit = json['space_limit']
+        if 'check_mode' in json:
+            self.check_mode = CheckModeType(json['check_mode'])
 
 
     def to_json(self):
@@ -53,7 +75,8 @@ class Problem(db.Document):
             id = str(self.pk),
             title = self.title,
             time_limit = self.time_limit,
-            space_limit = self.space_limit
+            space_limit = self.space_limit,
+            check_mode = self.check_mode.name
         )
 
 
@@ -88,123 +111,40 @@ class Result(db.Document):
     }
 
 
-    @staticmethod
-    def _make_query_ids(tid, pid):
-        tqid = "teams__%s" % tid
-        pqid = "teams__%s__problems__%s" % (tid, pid)
-        return tqid, pqid
-
-
-    def _check_existence(self, tid, pid):
-        tqid, pqid = self._make_query_ids(tid, pid)
-
-        find_query = {
-            "pk": str(self.pk),
-            tqid: None
-        }
-        update_query = {
-            tqid: self.default_team_data,
-            "add_to_set__sorted_team_ids": tid
-        }
-        Result.objects(**find_query).update(**update_query)
-
-        update_query = {("set__%s" % pqid): self.default_problem_data}
-        find_query = {
-            "pk": str(self.pk),
-            pqid: None
-        }
-        Result.objects(**find_query).update(**update_query)
-
-
-    def _sort(self, last_time_result_changed):
-
-        def compare(tid1, tid2):
-            r1 = teams[tid1]
-            r2 = teams[tid2]
-            if r1["solved_count"] == r2["solved_count"]:
-                return r1["penalty"] - r2["penalty"]
-            return r2["solved_count"] - r1["solved_count"]
-
-        aggregate_query = [
-            {
-                "$match": {
-                    "_id": self.pk
-                }
-            },
-            {
-                "$project": {
-                    "teams": "$teams",
-                    "sorted_team_ids": "$sorted_team_ids"
-                }
-            }
-        ]
+    def persist(self, teams, sorted_team_ids):
+        Result.objects(pk=str(self.pk)).update(
+            set__teams = teams,
+            set__sorted_team_ids = sorted_team_ids,
+            set__last_time_result_changed = utcnowts(microseconds=True)
+        )
+
+
+    def recompute(self, contest_obj, submissions, penalty=20):
+        ## replays the judged submissions (a query) with the same rules as the live scoreboard,
+        ## live verdicts during the recompute are kept by the scoreboard rebuild
+        scoreboard.begin_rebuild(contest_obj)
+        records = SubmissionRecord.from_docs(SubmissionRecord.query(submissions.order_by('submitted_at')))
 
-        aggregated_result = list(Result.objects.aggregate(*aggregate_query))[0]
-        teams = aggregated_result['teams']
-        sorted_team_ids = aggregated_result['sorted_team_ids']
-        sorted_team_ids.sort(cmp=compare)
-
-        find_query = {
-            "pk": str(self.pk),
-            "last_time_result_changed": last_time_result_changed
-        }
-        Result.objects(**find_query).update(set__sorted_team_ids=sorted_team_ids)
-
-
-    def update_failed_try(self, tid, pid, submitted_at, penalty=20):
-        self._check_existence(tid, pid)
-        tqid, pqid = self._make_query_ids(tid, pid)
-
-        find_query = {
-            "pk": str(self.pk),
-            ("%s__solved" % pqid): False
-        }
-        update_query = {
-            ("set__%s__submitted_at" % pqid): submitted_at,
-            ("inc__%s__failed_tries" % pqid): 1,
-            ("inc__%s__penalty" % pqid): penalty
-        }
-        Result.objects(**find_query).update(**update_query)
-
-
-    def update_succeed_try(self, tid, pid, submitted_at, contest_starts_at):
-        self._check_existence(tid, pid)
-        tqid, pqid = self._make_query_ids(tid, pid)
-
-        find_query = {
-            "pk": str(self.pk),
-            ("%s__solved" % pqid): False
-        }
-        update_query = {
-            ("set__%s__submitted_at" % pqid): submitted_at,
-            ("set__%s__solved" % pqid): True,
-            ("inc__%s__penalty" % pqid): (submitted_at - contest_starts_at) // 60,
-            ("inc__%s__solved_count" % tqid): 1
-        }
-
-        if Result.objects(**find_query).update(**update_query):
-            aggregate_query = [
-                {
-                    "$match": {
-                        "_id": self.pk
-                    }
-                },
-                {
-                    "$project": {
-                        "last_penalty": ("$teams.%s.problems.%s.penalty" % (tid, pid))
-                    }
-                }
-            ]
-            aggregated_result = list(Result.objects.aggregate(*aggregate_query))[0]
-            last_penalty = aggregated_result['last_penalty']
-            last_time_result_changed = utcnowts(microseconds=True)
-            update_query = {
-                ("inc__%s__penalty" % tqid): last_penalty,
-                "set__last_time_result_changed": last_time_result_changed
-            }
-
-            Result.objects(pk=str(self.pk)).update(**update_query)
-            self._sort(last_time_result_changed)
+        teams = {}
+        for s in records:
+            tid, pid = str(s.team), str(s.problem)
+            team = teams.setdefault(tid, dict(self.default_team_data, problems={}))
+            problem = team['problems'].setdefault(pid, dict(self.default_problem_data))
+            if problem['solved']:
+                continue
+
+            problem['submitted_at'] = s.submitted_at
+            if s.status == JudgementStatusType.Accepted.value:
+                problem['solved'] = True
+                problem['penalty'] += (s.submitted_at - contest_obj.starts_at) // 60
+                team['solved_count'] += 1
+                team['penalty'] += problem['penalty']
+            else:
+                problem['failed_tries'] += 1
+                problem['penalty'] += penalty
+
+        teams, sorted_team_ids = scoreboard.rebuild(contest_obj, teams, [str(s.id) for s in records], penalty)
+        self.persist(teams, sorted_team_ids)
 
 
 
@@ -215,6 +155,9 @@ class Contest(db.Document):
     created_at = db.IntField(required=True, default=lambda: utcnowts())
     starts_at = db.IntField(required=True)
     ends_at = db.IntField(required=True)
+    fail_fast = db.BooleanField(default=True)
+    judge_weight = db.IntField(default=1) # share of the judge in fair scheduling between contests
+    version = db.IntField(default=0) # increased on every change of the contest, its teams or problems
     pending_teams = db.ListField(db.ReferenceField('Team', reverse_delete_rule=db.PULL))
     accepted_teams = db.ListField(db.ReferenceField('Team', reverse_delete_rule=db.PULL))
     problems = db.ListField(db.ReferenceField('Problem', reverse_delete_rule=db.PULL))
@@ -223,9 +166,9 @@ class Contest(db.Document):
     meta = {
         'collection': 'contests',
         'indexes': [
-            '-starts_at',
-            'owner',
-            'admins',
+            ('-starts_at', '-id'),
+            ('owner', '-starts_at', '-id'),
+            ('admins', '-starts_at', '-id'),
             'pending_teams',
             'accepted_teams',
             'problems'
@@ -249,26 +192,31 @@ class Contest(db.Document):
             document.result.delete()
 
 
+    @property
+    def stage(self):
+        now = utcnowts()
+        if now < self.starts_at:
+            return 0
+        return 1 if now <= self.ends_at else 2
+
+
     def save(self):
         if not (self.created_at < self.starts_at < self.ends_at):
             raise ContestDateTimeError()
         super(Contest, self).save()
-
-
-    def is_user_in_contest(self, user_obj):
-        for team in self.accepted_teams:
-            if team.is_user_in_team(user_obj):
-                return True
-        return False
-
-
-    def user_joining_status(self, user_obj):
-        for team in self.accepted_teams:
-            if team.is_user_in_team(user_obj):
-                return 2, team
-        for team in self.pending_teams:
-            if team.is_user_in_team(user_obj):
-                return 1, team
+        ## atomic, as the version is also increased by the update queries of the other requests
+        self.update(inc__version=1)
+        self.reload('version')
+
+
+    def user_joining_status(self, user_teams):
+        ## user_teams are the teams of the user by id (Team.user_teams_abs), teams aren't dereferenced
+        for tid in field_ids(self, 'accepted_teams'):
+            if tid in user_teams:
+                return 2, user_teams[tid]
+        for tid in field_ids(self, 'pending_teams'):
+            if tid in user_teams:
+                return 1, user_teams[tid]
         return 0, None
 
 
@@ -279,6 +227,8 @@ class Contest(db.Document):
             self.starts_at = json['starts_at']
         if 'ends_at' in json:
             self.ends_at = json['ends_at']
+        if 'fail_fast' in json:
+            self.fail_fast = json['fail_fast']
 
 
     def to_json(self):
@@ -291,64 +241,90 @@ class Contest(db.Document):
             ends_at = self.ends_at,
             is_active = True if self.starts_at <= utcnowts() <= self.ends_at else False,
             is_ended = True if self.ends_at < utcnowts() else False,
-            pending_teams_num = len(self.pending_teams),
-            accepted_teams_num = len(self.accepted_teams)
+            fail_fast = self.fail_fast,
+            pending_teams_num = len(field_ids(self, 'pending_teams')),
+            accepted_teams_num = len(field_ids(self, 'accepted_teams'))
         )
 
 
-    def to_json_user(self, user_obj):
+    def to_json_user(self, user_obj, user_teams=None):
+        if user_teams is None:
+            user_teams = Team.user_teams_abs(user_obj)
+
         json = self.to_json()
-        status, team = self.user_joining_status(user_obj)
+        status, team = self.user_joining_status(user_teams)
         json['joining_status'] = dict(
             status=status,
-            team=team.to_json_abs() if team else None
+            team=team
         )
-        json['is_owner'] = user_obj == self.owner
-        json['is_admin'] = user_obj in self.admins
+        json['is_owner'] = user_obj.pk == field_id(self, 'owner')
+        json['is_admin'] = user_obj.pk in field_ids(self, 'admins')
         return json
 
 
     def to_json_admins(self):
+        admin_ids = field_ids(self, 'admins')
+        loader = Loader().want(UserAbsRecord, admin_ids).load()
         return dict(
-            admins = [admin.to_json_abs() for admin in self.admins]
+            admins = [u.to_json() for u in loader.get_list(UserAbsRecord, admin_ids)]
         )
 
 
     def to_json_teams(self, category):
-        if category == 'pending':
-            return dict(
-                pending_teams = [team.to_json() for team in self.pending_teams]
-            )
-        elif category == 'accepted':
-            return dict(
-                accepted_teams = [team.to_json() for team in self.accepted_teams]
-            )
-        else:
-            return dict(
-                pending_teams = [team.to_json() for team in self.pending_teams],
-                accepted_teams = [team.to_json() for team in self.accepted_teams]
-            )
+        categories = [category] if category in ['pending', 'accepted'] else ['pending', 'accepted']
+        team_ids = [(c, field_ids(self, '%s_teams' % c)) for c in categories]
+
+        loader = Loader()
+        for _, ids in team_ids:
+            loader.want(TeamRecord, ids)
+        loader.load()
+
+        ## members of the teams of every category are fetched together
+        teams = [(c, loader.get_list(TeamRecord, ids)) for c, ids in team_ids]
+        jsons = iter(TeamRecord.to_json_list([t for _, ts in teams for t in ts]))
+        return dict(('%s_teams' % c, [next(jsons) for _ in ts]) for c, ts in teams)
 
 
     def to_json_problems(self):
+        problem_ids = field_ids(self, 'problems')
+        loader = Loader().want(ProblemAbsRecord, problem_ids).load()
         return dict(
-            problems = [prob.to_json_abs() for prob in self.problems]
+            problems = [p.to_json() for p in loader.get_list(ProblemAbsRecord, problem_ids)]
         )
 
 
     def to_json_result(self):
-        sorted_teams = [Team.objects.get(pk=tid) for tid in self.result.sorted_team_ids]
-        accepted_teams = set(self.accepted_teams)
-
-        all_teams = [t for t in sorted_teams if t in accepted_teams]
-        all_teams += accepted_teams.difference(sorted_teams)
-        all_teams = [dict(id=str(t.pk), name=t.name) for t in all_teams]
-
-        return dict(
-            result = self.result.teams,
-            teams = all_teams,
-            problems = [p.to_json_abs() for p in self.problems]
+        accepted_team_ids = field_ids(self, 'accepted_teams')
+        problem_ids = field_ids(self, 'problems')
+
+        ## the rendered result is cached until the scoreboard or the contest changes
+        def make_key(version):
+            return "contest_result:%s:%s:%s" % (self.pk, self.version, version)
+
+        json = cache.get(make_key(scoreboard.version(self)))
+        if json is not None:
+            return json
+
+        teams, sorted_team_ids, version = scoreboard.load(self)
+
+        loader = Loader()
+        loader.want(TeamNameRecord, accepted_team_ids)
+        loader.want(ProblemAbsRecord, problem_ids)
+        loader.load()
+
+        ## the scoreboard keys teams by the string of their id
+        team_ids = dict((str(tid), tid) for tid in accepted_team_ids)
+        ranked = [tid for tid in sorted_team_ids if tid in team_ids]
+        unranked = set(team_ids).difference(ranked)
+        ranked += [str(tid) for tid in accepted_team_ids if str(tid) in unranked]
+
+        json = dict(
+            result = teams,
+            teams = [t.to_json() for t in loader.get_list(TeamNameRecord, [team_ids[tid] for tid in ranked])],
+            problems = [p.to_json() for p in loader.get_list(ProblemAbsRecord, problem_ids)]
         )
+        cache.set(make_key(version), json, timeout=app.config['RESULT_CACHE_TIMEOUT'])
+        return json
 
 
 db.post_save.connect(Contest.post_save, sender=Contest)
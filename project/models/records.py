@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# project imports
+from project.modules.datetime import utcnowts
+from project.modules.loader import Loader
+from project.modules.ijudge.types import JudgementStatusType, ProgrammingLanguageType
+
+
+## read models of the list endpoints: rows of projected as_pymongo queries in __slots__ records,
+## without the validation, enum conversion and reference proxies of documents
+
+STATUS_NAMES = dict((s.value, s.name) for s in JudgementStatusType)
+PROG_LANG_NAMES = dict((l.value, l.name) for l in ProgrammingLanguageType)
+
+
+class Record(object):
+    """
+    A record is built from a raw document projected to its `fields`.
+    `document` is the name of the model, records are loaded in batches by modules.loader.
+    """
+    __slots__ = ('id',)
+    document = None
+    fields = ()
+
+    @classmethod
+    def query(cls, queryset):
+        return queryset.only(*cls.fields).as_pymongo()
+
+
+    @classmethod
+    def from_docs(cls, docs):
+        return [cls(doc) for doc in docs]
+
+
+
+class UserAbsRecord(Record):
+    __slots__ = ('username',)
+    document = 'User'
+    fields = ('username',)
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.username = doc['username']
+
+
+    def to_json(self):
+        return dict(
+            id = str(self.id),
+            username = self.username
+        )
+
+
+
+class UserRecord(Record):
+    __slots__ = ('username', 'email', 'firstname', 'lastname')
+    document = 'User'
+    fields = ('username', 'email', 'firstname', 'lastname')
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.username = doc['username']
+        self.email = doc['email']
+        self.firstname = doc.get('firstname')
+        self.lastname = doc.get('lastname')
+
+
+    def to_json(self):
+        return dict(
+            id = str(self.id),
+            username = self.username,
+            email = self.email,
+            firstname = self.firstname,
+            lastname = self.lastname
+        )
+
+
+
+class ProblemAbsRecord(Record):
+    __slots__ = ('title',)
+    document = 'Problem'
+    fields = ('title',)
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.title = doc['title']
+
+
+    def to_json(self):
+        return dict(
+            id = str(self.id),
+            title = self.title
+        )
+
+
+
+class TeamNameRecord(Record):
+    __slots__ = ('name',)
+    document = 'Team'
+    fields = ('name',)
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.name = doc['name']
+
+
+    def to_json(self):
+        return dict(
+            id = str(self.id),
+            name = self.name
+        )
+
+
+
+class TeamAbsRecord(Record):
+    __slots__ = ('name', 'owner')
+    document = 'Team'
+    fields = ('name', 'owner')
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.name = doc['name']
+        self.owner = doc['owner']
+
+
+    @classmethod
+    def to_json_dict(cls, records):
+        ## to_json of the teams by team id, owners are fetched with one query
+        loader = Loader().want(UserRecord, [t.owner for t in records]).load()
+        return dict((t.id, t.to_json(loader)) for t in records)
+
+
+    def to_json(self, loader):
+        return dict(
+            id = str(self.id),
+            name = self.name,
+            owner = loader.get(UserRecord, self.owner).to_json()
+        )
+
+
+
+class TeamRecord(Record):
+    __slots__ = ('name', 'owner', 'members')
+    document = 'Team'
+    fields = ('name', 'owner', 'members')
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.name = doc['name']
+        self.owner = doc['owner']
+        self.members = doc.get('members', [])
+
+
+    @classmethod
+    def to_json_list(cls, records):
+        ## owners and members of all the teams are fetched with one query
+        user_ids = [t.owner for t in records] + [uid for t in records for uid in t.members]
+        loader = Loader().want(UserAbsRecord, user_ids).load()
+        return [t.to_json(loader) for t in records]
+
+
+    def to_json(self, loader):
+        return dict(
+            id = str(self.id),
+            name = self.name,
+            owner = loader.get(UserAbsRecord, self.owner).to_json(),
+            members = [u.to_json() for u in loader.get_list(UserAbsRecord, self.members)]
+        )
+
+
+
+class ContestRecord(Record):
+    __slots__ = (
+        'name', 'owner', 'admins', 'created_at', 'starts_at', 'ends_at',
+        'fail_fast', 'pending_teams', 'accepted_teams'
+    )
+    document = 'Contest'
+    fields = (
+        'name', 'owner', 'admins', 'created_at', 'starts_at', 'ends_at',
+        'fail_fast', 'pending_teams', 'accepted_teams'
+    )
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.name = doc['name']
+        self.owner = doc['owner']
+        self.admins = doc.get('admins', [])
+        self.created_at = doc['created_at']
+        self.starts_at = doc['starts_at']
+        self.ends_at = doc['ends_at']
+        self.fail_fast = doc.get('fail_fast', True)
+        self.pending_teams = doc.get('pending_teams', [])
+        self.accepted_teams = doc.get('accepted_teams', [])
+
+
+    @classmethod
+    def to_json_list(cls, records, user_obj=None, user_teams=None):
+        ## owners of all the contests are fetched with one query
+        loader = Loader().want(UserAbsRecord, [c.owner for c in records]).load()
+        now = utcnowts()
+        if user_obj is None:
+            return [c.to_json(loader, now) for c in records]
+        return [c.to_json_user(user_obj, user_teams, loader, now) for c in records]
+
+
+    def user_joining_status(self, user_teams):
+        ## same as Contest.user_joining_status
+        for tid in self.accepted_teams:
+            if tid in user_teams:
+                return 2, user_teams[tid]
+        for tid in self.pending_teams:
+            if tid in user_teams:
+                return 1, user_teams[tid]
+        return 0, None
+
+
+    def to_json(self, loader, now):
+        return dict(
+            id = str(self.id),
+            name = self.name,
+            owner = loader.get(UserAbsRecord, self.owner).to_json(),
+            created_at = self.created_at,
+            starts_at = self.starts_at,
+            ends_at = self.ends_at,
+            is_active = self.starts_at <= now <= self.ends_at,
+            is_ended = self.ends_at < now,
+            fail_fast = self.fail_fast,
+            pending_teams_num = len(self.pending_teams),
+            accepted_teams_num = len(self.accepted_teams)
+        )
+
+
+    def to_json_user(self, user_obj, user_teams, loader, now):
+        json = self.to_json(loader, now)
+        status, team = self.user_joining_status(user_teams)
+        json['joining_status'] = dict(
+            status=status,
+            team=team
+        )
+        json['is_owner'] = user_obj.pk == self.owner
+        json['is_admin'] = user_obj.pk in self.admins
+        return json
+
+
+
+class SubmissionRecord(Record):
+    __slots__ = ('filename', 'prog_lang', 'submitted_at', 'problem', 'team', 'user', 'status', 'reason')
+    document = 'Submission'
+    fields = ('filename', 'prog_lang', 'submitted_at', 'problem', 'team', 'user', 'status', 'reason')
+
+    def __init__(self, doc):
+        self.id = doc['_id']
+        self.filename = doc.get('filename')
+        self.prog_lang = doc.get('prog_lang')
+        self.submitted_at = doc['submitted_at']
+        self.problem = doc['problem']
+        self.team = doc.get('team')
+        self.user = doc.get('user')
+        self.status = doc['status']
+        self.reason = doc.get('reason')
+
+
+    @property
+    def status_name(self):
+        return STATUS_NAMES[self.status]
+
+
+    @property
+    def prog_lang_name(self):
+        return PROG_LANG_NAMES[self.prog_lang]
+
+
+    @classmethod
+    def to_json_list(cls, records):
+        ## problems and users of all the submissions are fetched with a single query each
+        loader = Loader()
+        loader.want(ProblemAbsRecord, [s.problem for s in records])
+        loader.want(UserAbsRecord, [s.user for s in records])
+        loader.load()
+        return [s.to_json(loader) for s in records]
+
+
+    def to_json(self, loader):
+        return dict(
+            id = str(self.id),
+            filename = self.filename,
+            prog_lang = PROG_LANG_NAMES[self.prog_lang],
+            submitted_at = self.submitted_at,
+            problem = loader.get(ProblemAbsRecord, self.problem).to_json(),
+            user = loader.get(UserAbsRecord, self.user).to_json(),
+            status = STATUS_NAMES[self.status],
+            reason = self.reason
+        )
@@ -35,9 +35,9 @@ class Submission(db.Document):
         'indexes': [
             '-submitted_at',
             'contest',
-            ('contest', 'team'),
+            ('contest', 'team', '-submitted_at', '-id'),
             ('contest', 'problem'),
-            ('contest', 'problem', 'team')
+            ('contest', 'problem', 'team', '-submitted_at', '-id')
         ]
     }
 
@@ -67,7 +67,7 @@ class Submission(db.Document):
 
     def populate(self, json):
         self.filename = json['filename']
-        self.prog_lang = json['prog_lang']
+        self.prog_lang = ProgrammingLanguageType(json['prog_lang'])
 
 
     def to_json(self):
@@ -2,8 +2,10 @@
 __author__ = 'AminHP'
 
 # project imports
-from project.extensions import db
+from project.extensions import db, redis
+from project.modules.loader import field_id, field_ids
 from project.models.user import User
+from project.models.records import TeamRecord, TeamAbsRecord
 
 
 class Team(db.Document):
@@ -21,17 +23,39 @@ class Team(db.Document):
     }
 
 
+    @staticmethod
+    def teams_version_key(user_id):
+        return "user_teams_version:%s" % user_id
+
+
+    @classmethod
+    def teams_version(cls, user_id):
+        ## increased on every change of the teams the user owns or is a member of
+        return int(redis.get(cls.teams_version_key(user_id)) or 0)
+
+
+    def touch(self, user_ids=()):
+        ## user_ids are the users who left the team
+        user_ids = set([field_id(self, 'owner')] + field_ids(self, 'members') + list(user_ids))
+        pipe = redis.pipeline()
+        for user_id in user_ids:
+            pipe.incr(self.teams_version_key(user_id))
+        pipe.execute()
+
+
     @classmethod
     def teams(cls, user_obj):
-        owner_teams = cls.objects.filter(owner=user_obj)
-        owner_teams = [t.to_json() for t in owner_teams]
-        member_teams = cls.objects.filter(members=user_obj)
-        member_teams = [t.to_json() for t in member_teams]
-        return dict(owner_teams=owner_teams, member_teams=member_teams)
+        owner_teams = TeamRecord.from_docs(TeamRecord.query(cls.objects.filter(owner=user_obj)))
+        member_teams = TeamRecord.from_docs(TeamRecord.query(cls.objects.filter(members=user_obj)))
+        teams = TeamRecord.to_json_list(owner_teams + member_teams)
+        return dict(owner_teams=teams[:len(owner_teams)], member_teams=teams[len(owner_teams):])
 
 
-    def is_user_in_team(self, user_obj):
-        return user_obj == self.owner or user_obj in self.members
+    @classmethod
+    def user_teams_abs(cls, user_obj):
+        ## to_json_abs of the teams the user owns or is a member of, by team id
+        teams = TeamAbsRecord.query(cls.objects.filter(db.Q(owner=user_obj) | db.Q(members=user_obj)))
+        return TeamAbsRecord.to_json_dict(TeamAbsRecord.from_docs(teams))
 
 
     def populate(self, json):
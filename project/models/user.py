@@ -5,7 +5,7 @@ __author__ = 'AminHP'
 from passlib.apps import custom_app_context as pwd_context
 
 # project imports
-from project.extensions import db
+from project.extensions import db, auth
 
 
 class User(db.Document):
@@ -24,6 +24,22 @@ class User(db.Document):
     }
 
 
+    @classmethod
+    def post_save(cls, sender, document, **kwargs):
+        auth.forget_user(document)
+        if kwargs.get('created'):
+            return
+
+        ## contests show their owner and admins, and the owners of their teams
+        from project.models.team import Team
+        from project.models.contest import Contest
+        team_ids = [t['_id'] for t in Team.objects(owner=document).only('id').as_pymongo()]
+        Contest.objects(
+            db.Q(owner=document) | db.Q(admins=document) |
+            db.Q(pending_teams__in=team_ids) | db.Q(accepted_teams__in=team_ids)
+        ).update(inc__version=1)
+
+
     def hash_password(self, password):
         password = password.encode('utf-8')
         self.password = pwd_context.encrypt(password)
@@ -67,3 +83,6 @@ class User(db.Document):
             id = str(self.pk),
             username = self.username
         )
+
+
+db.post_save.connect(User.post_save, sender=User)
@@ -2,17 +2,75 @@
 __author__ = 'AminHP'
 
 # python imports
+import time
+import threading
 from functools import wraps
+from collections import OrderedDict
 
 # flask imports
 from flask import request, abort, g
+from werkzeug.utils import cached_property
 from uuid import uuid4
 
 
+## only the live tokens are updated (HSET keeps their expiry), expired ones aren't recreated
+UPDATE_TOKENS_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HMSET', key, 'username', ARGV[1], 'version', ARGV[2])
+    end
+end
+"""
+
+class UserCache(object):
+    """
+    Per process LRU of recently authenticated users (their raw documents),
+    entries expire after a short timeout or when the version in the token is newer.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is None or entry[1] != version or entry[2] < time.time() - self.timeout:
+                return None
+            self._entries[user_id] = entry
+            return entry[0]
+
+
+    def set(self, user_id, son, version):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (son, version, time.time())
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+
 class Auth(object):
+    """
+    Tokens are redis hashes of the user id, username and version, expiring after
+    TOKEN_EXPIRE_TIME without use. Tokens of each user are kept in a set, so they can be
+    updated or expired together. The version is increased on every save of the user.
+    """
+    prefix = 'token:'
+
     def __init__(self, redis_connection, app=None):
         self.redis = redis_connection
         self.app = app
+        self.users = None
+        self._update_tokens = None
         if app:
             self.init_app(app)
 
@@ -20,16 +78,105 @@ class Auth(object):
     def init_app(self, app):
         self.app = app
         self.token_expire_time = self.app.config['TOKEN_EXPIRE_TIME']
+        self.users = UserCache(self.app.config['USER_CACHE_SIZE'], self.app.config['USER_CACHE_TIMEOUT'])
+
+        ## g.user is the authenticated user, loaded on first access in each request
+        auth = self
+        class AuthGlobals(app.app_ctx_globals_class):
+            @cached_property
+            def user(self):
+                return auth.load_user(self.user_id, self.user_version)
+        app.app_ctx_globals_class = AuthGlobals
+
+
+    def token_key(self, token):
+        return self.prefix + token
+
+
+    def user_tokens_key(self, user_id):
+        return "user_tokens:%s" % user_id
+
+
+    def user_version_key(self, user_id):
+        return "user_version:%s" % user_id
+
 
+    def load_user(self, user_id, version):
+        from project.models.user import User
 
-    def generate_token(self, user_id):
+        son = self.users.get(user_id, version)
+        if son is None:
+            son = User.objects.get(pk=user_id).to_mongo()
+            self.users.set(user_id, son, version)
+        ## a new document in every request, so changes in a request never leak into the cache
+        return User._from_son(son)
+
+
+    def forget_user(self, user_obj):
+        ## the new username and version are written into every token of the user
+        user_id = str(user_obj.pk)
+        self.users.delete(user_id)
+        version = self.redis.incr(self.user_version_key(user_id))
+        tokens = self.redis.smembers(self.user_tokens_key(user_id))
+        if tokens:
+            if self._update_tokens is None:
+                self._update_tokens = self.redis.register_script(UPDATE_TOKENS_SCRIPT)
+            self._update_tokens(keys=[self.token_key(token) for token in tokens], args=[user_obj.username, version])
+        self.prune_tokens(user_id)
+
+
+    def generate_token(self, user_obj):
+        user_id = str(user_obj.pk)
         token = str(uuid4())
-        self.redis.setex(token, user_id, self.token_expire_time)
+        version = int(self.redis.get(self.user_version_key(user_id)) or 0)
+
+        pipe = self.redis.pipeline()
+        pipe.hmset(self.token_key(token), dict(user_id=user_id, username=user_obj.username, version=version))
+        pipe.expire(self.token_key(token), self.token_expire_time)
+        pipe.sadd(self.user_tokens_key(user_id), token)
+        pipe.execute()
+        self.prune_tokens(user_id)
         return token
 
 
+    def prune_tokens(self, user_id):
+        ## drops the expired tokens from the set of the user
+        tokens = list(self.redis.smembers(self.user_tokens_key(user_id)))
+        pipe = self.redis.pipeline()
+        for token in tokens:
+            pipe.exists(self.token_key(token))
+        expired = [token for token, exists in zip(tokens, pipe.execute()) if not exists]
+        if expired:
+            self.redis.srem(self.user_tokens_key(user_id), *expired)
+
+
     def expire_token(self):
-        self.redis.delete(request.headers['Access-Token'])
+        token = request.headers['Access-Token']
+        pipe = self.redis.pipeline()
+        pipe.delete(self.token_key(token))
+        pipe.srem(self.user_tokens_key(g.user_id), token)
+        pipe.execute()
+
+
+    def expire_all_tokens(self, user_id):
+        key = self.user_tokens_key(user_id)
+        tokens = self.redis.smembers(key)
+        self.redis.delete(key, *[self.token_key(token) for token in tokens])
+
+
+    def check_token(self, token):
+        ## reads the token and slides its expiry in one round trip
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.token_key(token))
+        pipe.expire(self.token_key(token), self.token_expire_time)
+        data, _ = pipe.execute()
+
+        if not data or 'user_id' not in data:
+            return abort(401, "Token is invalid or has expired")
+
+        g.user_id = data['user_id']
+        g.username = data['username']
+        g.user_version = int(data['version'])
 
 
     def authenticate(self, f):
@@ -39,13 +186,22 @@ class Auth(object):
             if not 'Access-Token' in request.headers:
                 return abort(401, "Set token to access protected routes")
 
-            token = request.headers['Access-Token']
-            user_id = self.redis.get(token)
+            self.check_token(request.headers['Access-Token'])
+            return f(*args, **kwargs)
+
+        return decorated
+
 
-            if not user_id:
-                return abort(401, "Token is invalid or has expired")
+    def authenticate_stream(self, f):
+        ## EventSource can't set headers, so the token may come in the query string too
+        @wraps(f)
+        def decorated(*args, **kwargs):
+
+            token = request.headers.get('Access-Token') or request.args.get('access_token')
+            if not token:
+                return abort(401, "Set token to access protected routes")
 
-            g.user_id = user_id
+            self.check_token(token)
             return f(*args, **kwargs)
 
         return decorated
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import hashlib
+
+# flask imports
+from flask import request, jsonify, make_response
+
+
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(p) for p in parts)).hexdigest()
+
+
+def is_not_modified(etag):
+    return etag in request.if_none_match
+
+
+def etag_response(json, etag, status=200):
+    response = jsonify(json)
+    response.set_etag(etag)
+    return response, status
+
+
+def not_modified_response(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
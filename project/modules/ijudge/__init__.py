@@ -2,9 +2,30 @@
 __author__ = 'AminHP'
 
 from .core import run
-from .types import JudgementStatusType
+from .sandbox import Sandbox, SandboxBackend
+from .pool import ContainerPool, ContainerPoolError
+from .local import LocalBackend, LocalSandboxError
+from .cache import CompileCache
+from .manifest import build_manifest, load_manifest
+from .types import JudgementStatusType, CheckModeType
 
 
-def judge(code_path, prog_lang, testcase_dir, time_limit, space_limit):
-    status, reason = run(code_path, prog_lang.name, testcase_dir, time_limit, space_limit)
+container_pool = ContainerPool()
+local_runner = LocalBackend()
+compile_cache = CompileCache()
+
+backends = [container_pool, local_runner]
+
+
+def get_backend():
+    for backend in backends:
+        if backend.enabled:
+            return backend
+    raise ValueError("Unknown judge backend")
+
+
+def judge(code_path, prog_lang, testcase_dir, time_limit, space_limit, fail_fast=True,
+          check_mode=CheckModeType.Trailing):
+    status, reason = run(code_path, prog_lang.name, testcase_dir, time_limit, space_limit,
+                         get_backend(), compile_cache, fail_fast, check_mode)
     return status, reason
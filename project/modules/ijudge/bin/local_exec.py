@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+## exec'd by the local backend in front of every sandboxed command (python -S -E local_exec.py <options> <cmd>...).
+## The sandbox is set up here as root, after exec, instead of in a preexec_fn of the threaded worker.
+## The command runs in a new pid namespace as the judge user, under an init which is the only child of the
+## helper; the helper stays outside as root, kills the namespace on SIGTERM and exits with the status of the command.
+## Setup errors are written to options['error_fp'].
+
+# python imports
+import os
+import sys
+import errno
+import json
+import fcntl
+import ctypes
+import signal
+import resource
+
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUTS = 0x04000000
+CLONE_NEWIPC = 0x08000000
+CLONE_NEWPID = 0x20000000
+CLONE_NEWNET = 0x40000000
+
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+
+PR_SET_PDEATHSIG = 1
+
+## fresh for every run, so nothing is shared with the host or the other runs
+TMP_DIRS = ['/tmp', '/var/tmp', '/dev/shm']
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+
+def check(result, name):
+    if result != 0:
+        code = ctypes.get_errno()
+        raise OSError(code, "%s failed: %s" % (name, os.strerror(code)))
+
+
+def mount(source, target, fstype, flags, data):
+    ## the options are json (unicode), ctypes would pass unicode as wchar_t*
+    args = [s.encode('utf-8') if isinstance(s, unicode) else s for s in (source, target, fstype)]
+    check(libc.mount(args[0], args[1], args[2], flags, data), "mount %s" % target)
+
+
+def setup(options):
+    os.setsid()
+    ## only the children of the helper are in the new pid namespace
+    check(libc.unshare(CLONE_NEWNS | CLONE_NEWUTS | CLONE_NEWIPC | CLONE_NEWNET | CLONE_NEWPID), "unshare")
+    mount(None, "/", None, MS_REC | MS_PRIVATE, None)
+
+    ## the data dirs (testcases, submissions, compile cache, other workspaces) are covered by
+    ## empty tmpfs mounts, then the workspace is bound back in place
+    workspace = options['workspace']
+    workspace_fd = os.open(workspace, os.O_RDONLY)
+    for path in TMP_DIRS:
+        if os.path.isdir(path):
+            mount("tmpfs", path, "tmpfs", MS_NOSUID | MS_NODEV, "size=64m,mode=1777")
+    for path in options['hidden_dirs']:
+        ## already gone if it was under a tmp dir
+        if os.path.isdir(path):
+            mount("tmpfs", path, "tmpfs", MS_NOSUID | MS_NODEV | MS_NOEXEC, "size=16k,mode=0755")
+    if not os.path.isdir(workspace):
+        os.makedirs(workspace)
+    mount("/proc/self/fd/%s" % workspace_fd, workspace, None, MS_BIND, None)
+    os.close(workspace_fd)
+
+
+def write_oom_score_adj(value):
+    ## not writable in some containers, it's only a guard
+    try:
+        with open('/proc/self/oom_score_adj', 'w') as f:
+            f.write(str(value))
+    except IOError:
+        pass
+
+
+def setup_init():
+    ## the namespace (every process of the run) dies with its init, and the init with the helper
+    check(libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0), "prctl")
+    mount("proc", "/proc", "proc", MS_NOSUID | MS_NODEV | MS_NOEXEC, None)
+
+
+def setup_program(options):
+    write_oom_score_adj(0)
+    ## only the program is in the cgroup, so the memory of the helpers isn't counted ("0" is the writer)
+    if options['cgroup']:
+        with open(os.path.join(options['cgroup'], 'cgroup.procs'), 'w') as f:
+            f.write("0")
+
+    mask = ctypes.c_ulong(1 << options['cpu'])
+    check(libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)), "sched_setaffinity")
+
+    for name, soft, hard in options['rlimits']:
+        resource.setrlimit(getattr(resource, name), (soft, hard))
+    stack_hard = resource.getrlimit(resource.RLIMIT_STACK)[1]
+    resource.setrlimit(resource.RLIMIT_STACK, (stack_hard, stack_hard))
+
+    os.setgroups([])
+    os.setgid(options['gid'])
+    os.setuid(options['uid'])
+    os.chdir(options['cwd'])
+
+
+def wait(pid):
+    ## the exit code of a shell: 128 + signal for a killed process
+    while True:
+        try:
+            status = os.waitpid(pid, 0)[1]
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def spawn(error_fd, setup_child, *args):
+    try:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            setup_child(*args)
+        return pid
+    except Exception as e:
+        os.write(error_fd, "%s: %s" % (type(e).__name__, e))
+        os._exit(1)
+
+
+def main():
+    options = json.loads(sys.argv[1])
+    cmd = sys.argv[2:]
+
+    ## SIGTERM kills the init of the namespace (SIGKILL of the helper would leave the program running)
+    init = []
+    killed = []
+    def kill(signum, frame):
+        killed.append(True)
+        if init:
+            os.kill(init[0], signal.SIGKILL)
+    signal.signal(signal.SIGTERM, kill)
+
+    ## opened before the privileges are dropped, closed by a successful exec
+    error_fd = os.open(options['error_fp'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    fcntl.fcntl(error_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+    try:
+        setup(options)
+        ## the oom killer of the cgroup never picks the helpers, the program sets its own back
+        write_oom_score_adj(-1000)
+    except Exception as e:
+        os.write(error_fd, "%s: %s" % (type(e).__name__, e))
+        os._exit(1)
+
+    ## the init is pid 1 of the namespace, the program is its child, so it gets the signals a process normally gets
+    pid = spawn(error_fd, setup_init)
+    if pid == 0:
+        pid = spawn(error_fd, setup_program, options)
+        if pid == 0:
+            try:
+                os.execv(cmd[0], cmd)
+            except Exception as e:
+                os.write(error_fd, "%s: %s" % (type(e).__name__, e))
+                os._exit(1)
+        os._exit(wait(pid))
+
+    init.append(pid)
+    if killed:
+        os.kill(pid, signal.SIGKILL)
+    os._exit(wait(pid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import uuid
+import fcntl
+import shutil
+import hashlib
+import tempfile
+
+
+LOCK_FILE = '.lock'
+
+
+class CompiledArtifact(object):
+    def __init__(self, key, path, lock_file):
+        self.key = key
+        self.path = path
+        self._lock_file = lock_file
+
+    @property
+    def compiled_dir(self):
+        return os.path.join(self.path, 'compiled')
+
+    @property
+    def compile_error_fp(self):
+        return os.path.join(self.path, 'compile.err')
+
+    @property
+    def error(self):
+        if not os.path.exists(self.compile_error_fp):
+            return None
+        error = open(self.compile_error_fp).read()
+        return error if error else None
+
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+
+class CompileCache(object):
+    """
+    Compiled artifacts by key, shared by the workers of a host.
+    An artifact returned by get or put is pinned (a shared flock on its lock file)
+    until it's released, and eviction skips pinned artifacts.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.dir = app.config['JUDGE_COMPILE_CACHE_DIR']
+        self.max_size = app.config['JUDGE_COMPILE_CACHE_SIZE']
+
+
+    @staticmethod
+    def make_key(code_path, pl_script_dir):
+        h = hashlib.sha1()
+        h.update(os.path.basename(code_path)) # java class name depends on file name
+        h.update(hashlib.sha1(open(code_path, 'rb').read()).digest())
+        h.update(os.path.basename(pl_script_dir))
+        h.update(hashlib.sha1(open(os.path.join(pl_script_dir, 'compile.sh'), 'rb').read()).digest())
+        return h.hexdigest()
+
+
+    def get(self, key):
+        path = os.path.join(self.dir, key)
+        lock_fp = os.path.join(path, LOCK_FILE)
+        try:
+            lock_file = open(lock_fp, 'a')
+        except IOError:
+            return None
+
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            ## it may have been evicted before the lock was taken
+            if os.fstat(lock_file.fileno()).st_ino != os.stat(lock_fp).st_ino:
+                raise OSError()
+            os.utime(path, None)
+        except OSError:
+            lock_file.close()
+            return None
+        return CompiledArtifact(key, path, lock_file)
+
+
+    def stage(self):
+        path = tempfile.mkdtemp(prefix='.stage-', dir=self.dir)
+        os.chmod(path, 0755)
+        return path
+
+
+    def put(self, key, staging_path):
+        path = os.path.join(self.dir, key)
+        with open(os.path.join(staging_path, '.size'), 'w') as f:
+            f.write(str(self._dir_size(staging_path)))
+        open(os.path.join(staging_path, LOCK_FILE), 'w').close()
+        try:
+            os.rename(staging_path, path)
+        except OSError:
+            ## another worker has already cached it
+            shutil.rmtree(staging_path, ignore_errors=True)
+        artifact = self.get(key)
+        self.evict()
+        return artifact
+
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for key in os.listdir(self.dir):
+            path = os.path.join(self.dir, key)
+            if key.startswith('.'):
+                continue
+            try:
+                size = int(open(os.path.join(path, '.size')).read())
+                mtime = os.stat(path).st_mtime
+            except (IOError, OSError, ValueError):
+                continue
+            total_size += size
+            entries.append((mtime, size, path))
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            if self._remove(path):
+                total_size -= size
+
+
+    def _remove(self, path):
+        try:
+            lock_file = open(os.path.join(path, LOCK_FILE), 'a')
+        except IOError:
+            return False
+
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                ## pinned by a running judge
+                return False
+            ## renamed first, so it can't be found while it's being removed
+            trash_path = os.path.join(self.dir, '.evict-%s' % uuid.uuid4().hex)
+            try:
+                os.rename(path, trash_path)
+            except OSError:
+                return False
+            shutil.rmtree(trash_path, ignore_errors=True)
+        return True
+
+
+    @staticmethod
+    def _dir_size(path):
+        size = 0
+        for root, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(root, filename))
+        return size
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import string
+import hashlib
+from itertools import izip_longest
+
+# project imports
+from .types import CheckModeType
+
+
+CHUNK_SIZE = 64 * 1024
+OUTPUT_LIMIT = 64 * 1024 * 1024
+FLOAT_TOLERANCE = 1e-6
+
+## digest field which each mode needs (manifests of older builds may not have it)
+DIGEST_KEYS = {
+    CheckModeType.Exact: 'sha1',
+    CheckModeType.Trailing: 'trimmed_sha1',
+    CheckModeType.Token: 'tokens_sha1'
+}
+
+
+def compare(code_output_fp, desired_output_fp, mode=CheckModeType.Trailing, desired_digest=None):
+    ## with the testcase manifest digest the desired output file isn't read at all
+    if desired_digest is not None and DIGEST_KEYS.get(mode) in desired_digest:
+        return compare_digest(code_output_fp, desired_digest, mode)
+
+    if mode == CheckModeType.Exact:
+        return compare_exact(code_output_fp, desired_output_fp)
+    if mode == CheckModeType.Trailing:
+        return compare_trailing(code_output_fp, desired_output_fp)
+    if mode == CheckModeType.Token:
+        return compare_tokens(code_output_fp, desired_output_fp, equal_tokens)
+    if mode == CheckModeType.Float:
+        return compare_tokens(code_output_fp, desired_output_fp, equal_floats)
+    raise ValueError("Unknown check mode: %s" % mode)
+
+
+def compare_digest(code_output_fp, desired_digest, mode):
+    if mode == CheckModeType.Exact:
+        size = os.path.getsize(code_output_fp)
+        if size != desired_digest['size']:
+            return False
+        return prefix_sha1(code_output_fp, size) == desired_digest['sha1']
+    if mode == CheckModeType.Trailing:
+        size = stripped_size(code_output_fp)
+        if size != desired_digest['trimmed_size']:
+            return False
+        return prefix_sha1(code_output_fp, size) == desired_digest['trimmed_sha1']
+    if mode == CheckModeType.Token:
+        return tokens_sha1(code_output_fp) == desired_digest['tokens_sha1']
+    raise ValueError("Unknown check mode: %s" % mode)
+
+
+def digest(fp):
+    size = os.path.getsize(fp)
+    start, end = trimmed_range(fp)
+    return dict(
+        size = size,
+        sha1 = prefix_sha1(fp, size),
+        trimmed_size = end - start,
+        trimmed_sha1 = prefix_sha1(fp, end - start, start),
+        tokens_sha1 = tokens_sha1(fp)
+    )
+
+
+def compare_exact(code_output_fp, desired_output_fp):
+    size = os.path.getsize(code_output_fp)
+    if size != os.path.getsize(desired_output_fp):
+        return False
+    return compare_prefix(code_output_fp, desired_output_fp, size)
+
+
+def compare_trailing(code_output_fp, desired_output_fp):
+    ## the trailing whitespaces of the output and both leading and trailing ones of the desired output are ignored
+    size = stripped_size(code_output_fp)
+    start, end = trimmed_range(desired_output_fp)
+    if size != end - start:
+        return False
+    return compare_prefix(code_output_fp, desired_output_fp, size, start)
+
+
+def compare_tokens(code_output_fp, desired_output_fp, equal):
+    for t1, t2 in izip_longest(read_tokens(code_output_fp), read_tokens(desired_output_fp)):
+        if t1 is None or t2 is None or not equal(t1, t2):
+            return False
+    return True
+
+
+def equal_tokens(t1, t2):
+    return t1 == t2
+
+
+def equal_floats(t1, t2):
+    if t1 == t2:
+        return True
+    try:
+        f1, f2 = float(t1), float(t2)
+    except ValueError:
+        return False
+    return abs(f1 - f2) <= FLOAT_TOLERANCE * max(1.0, abs(f2))
+
+
+def compare_prefix(fp1, fp2, size, offset2=0):
+    with open(fp1, 'rb') as f1, open(fp2, 'rb') as f2:
+        f2.seek(offset2)
+        while size > 0:
+            n = min(CHUNK_SIZE, size)
+            if f1.read(n) != f2.read(n):
+                return False
+            size -= n
+    return True
+
+
+def prefix_sha1(fp, size, offset=0):
+    h = hashlib.sha1()
+    with open(fp, 'rb') as f:
+        f.seek(offset)
+        while size > 0:
+            chunk = f.read(min(CHUNK_SIZE, size))
+            if not chunk:
+                break
+            h.update(chunk)
+            size -= len(chunk)
+    return h.hexdigest()
+
+
+def tokens_sha1(fp):
+    h = hashlib.sha1()
+    for token in read_tokens(fp):
+        h.update(token)
+        h.update(' ')
+    return h.hexdigest()
+
+
+def stripped_size(fp):
+    ## size of the file without its trailing whitespaces (reads the file backward)
+    size = os.path.getsize(fp)
+    with open(fp, 'rb') as f:
+        while size > 0:
+            n = min(CHUNK_SIZE, size)
+            f.seek(size - n)
+            chunk = f.read(n)
+            stripped = chunk.rstrip(string.whitespace)
+            if stripped:
+                return size - n + len(stripped)
+            size -= n
+    return 0
+
+
+def leading_size(fp):
+    ## size of the leading whitespaces of the file
+    size = 0
+    with open(fp, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return size
+            stripped = chunk.lstrip(string.whitespace)
+            size += len(chunk) - len(stripped)
+            if stripped:
+                return size
+
+
+def trimmed_range(fp):
+    ## start and end of the file content without its leading and trailing whitespaces
+    end = stripped_size(fp)
+    if end == 0:
+        return 0, 0
+    return leading_size(fp), end
+
+
+def read_tokens(fp):
+    rest = ''
+    with open(fp, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            tokens = (rest + chunk).split()
+            if not tokens:
+                rest = ''
+                continue
+            ## the last token may continue in the next chunk
+            if chunk[-1] in string.whitespace:
+                rest = ''
+            else:
+                rest = tokens.pop()
+            for token in tokens:
+                yield token
+    if rest:
+        yield rest
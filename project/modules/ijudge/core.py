@@ -2,20 +2,23 @@
 __author__ = ['SALAR', 'AminHP']
 
 # python imports
-import docker
 import os
 import imp
-import re
+import shutil
+import threading
 
 # project imports
-from .types import JudgementStatusType
+from .types import JudgementStatusType, CheckModeType
+from .manifest import load_manifest
+from . import checker
 
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 SCRIPTS_DIR = os.path.join(BASE_DIR, 'scripts')
 
 
-def run(code_path, prog_lang, testcase_dir, time_limit, space_limit):
+def run(code_path, prog_lang, testcase_dir, time_limit, space_limit, backend, compile_cache, fail_fast=True,
+        check_mode=CheckModeType.Trailing):
     prog_lang = prog_lang.lower()
     pl_script_dir = os.path.join(SCRIPTS_DIR, prog_lang)
     input_dir = os.path.join(testcase_dir, 'inputs')
@@ -27,130 +30,199 @@ def run(code_path, prog_lang, testcase_dir, time_limit, space_limit):
 
     time_limit = float(time_limit * config_mod.TIME_LIMIT_FACTOR)
 
-    run_in_container(code_path, pl_script_dir, input_dir, log_dir, time_limit, space_limit)
-    return check_result(log_dir, output_dir, time_limit, space_limit)
-
-
-
-def run_in_container(code_path, pl_script_dir, input_dir, log_dir, time_limit, space_limit):
-    code_filename = os.path.basename(code_path)
-
-    volumes = {
-        code_path: { 
-            'bind': "/etc/data/%s" % code_filename,
-            'mode': 'ro'
-        },
-        pl_script_dir: {
-            'bind': "/etc/data/plscript",
-            'mode': 'ro'
-        },
-        input_dir: {
-            'bind': "/etc/data/inputs",
-            'mode': 'ro'
-        },
-        log_dir: {
-            'bind': "/etc/data/%s.log" % code_filename,
-            'mode': 'rw'
-        }
-    }
-
-    env = {
-        "CODE_PATH": volumes[code_path]["bind"],
-        "PL_SCRIPT_DIR": volumes[pl_script_dir]["bind"],
-        "TESTCASE_DIR": volumes[input_dir]["bind"],
-        "LOG_DIR": volumes[log_dir]["bind"],
-        "TIME_LIMIT": time_limit
-    }
-
-    client = docker.from_env()
-    try:
-        client.containers.run(
-            image = "ijudge",
-            remove = True, 
-            stdout = True,
-            stderr = True,
-            mem_limit = "%sMB" % (space_limit + 10),
-            mem_swappiness = 0,
-            cpu_quota = 100000,
-            volumes = volumes,
-            environment = env
-        )
-    except docker.errors.ContainerError:
-        pass
-
-
-
-def check_result(log_dir, output_dir, time_limit, space_limit):
-    compile_error_fp = os.path.join(log_dir, "compile.err")
-
-    ## check compile error
-    st = check_compilation(compile_error_fp)
-    if st is not None:
-        return st, open(compile_error_fp).read()
+    manifest = load_manifest(testcase_dir)
+    digests = manifest['testcases'] if manifest else {}
 
-    for testcase in sorted([tc for tc in os.listdir(output_dir)]):
-        desired_output_fp = os.path.join(output_dir, testcase)
-        code_output_fp = "%s.out" % os.path.join(log_dir, testcase)
-        code_error_fp = "%s.err" % os.path.join(log_dir, testcase)
-        code_stat_fp = "%s.stt" % os.path.join(log_dir, testcase)
+    key = compile_cache.make_key(code_path, pl_script_dir)
+    artifact = compile_cache.get(key)
 
-        if not os.path.exists(code_error_fp):
-            continue
+    ## the artifact is pinned until the judge is done, so it isn't evicted while running
+    try:
+        ## cached compile errors are returned without starting a sandbox
+        if artifact and artifact.error:
+            return JudgementStatusType.CompileError, artifact.error
+
+        with backend.lease(prog_lang, space_limit, backend.concurrency) as sandboxes:
+            for sandbox in sandboxes:
+                sandbox.prepare(code_path)
+
+            if artifact is None:
+                staging_path = compile_cache.stage()
+                try:
+                    sandboxes[0].compile(staging_path)
+                    artifact = compile_cache.put(key, staging_path)
+                finally:
+                    ## put renames it into the cache, it's left only on failure
+                    shutil.rmtree(staging_path, ignore_errors=True)
+            if artifact.error:
+                return JudgementStatusType.CompileError, artifact.error
+
+            return run_testcases(sandboxes, artifact.compiled_dir, input_dir, output_dir, log_dir, time_limit,
+                                 space_limit, fail_fast, check_mode, digests)
+    finally:
+        if artifact is not None:
+            artifact.release()
+
+
+
+def run_testcases(sandboxes, compiled_dir, input_dir, output_dir, log_dir, time_limit, space_limit, fail_fast,
+                  check_mode, digests):
+    if os.path.exists(log_dir):
+        shutil.rmtree(log_dir)
+    os.makedirs(log_dir)
+
+    ## testcases are handed out in sorted order to the sandboxes (each one is pinned to its own cpu),
+    ## so when the testcase i fails every testcase before i has already been started
+    testcases = sorted(os.listdir(input_dir))
+    state = dict(next=0, failed=None, running={})
+    failures = {}
+    errors = []
+    lock = threading.Lock()
+
+    def slot(sandbox):
+        index = None
+        try:
+            while True:
+                with lock:
+                    index = state['next']
+                    if index >= len(testcases) or state['failed'] is not None:
+                        return
+                    state['next'] += 1
+                    state['running'][sandbox] = index
+
+                testcase = testcases[index]
+                if os.path.getsize(os.path.join(input_dir, testcase)):
+                    sandbox.run_testcase(compiled_dir, input_dir, testcase, time_limit)
+                    sandbox.collect(testcase, log_dir)
+
+                with lock:
+                    del state['running'][sandbox]
+                if not fail_fast:
+                    continue
+
+                st = check_testcase(log_dir, output_dir, testcase, time_limit, space_limit, check_mode, digests)
+                if st is None:
+                    continue
+                with lock:
+                    failures[index] = st
+                    if state['failed'] is None or index < state['failed']:
+                        state['failed'] = index
+                    ## stop the later testcases, their verdicts don't matter anymore
+                    stopping = [s for s, i in state['running'].items() if i > index]
+                for s in stopping:
+                    s.stop()
+        except Exception as e:
+            errors.append((index, e))
+
+    if len(sandboxes) == 1:
+        slot(sandboxes[0])
+    else:
+        threads = [threading.Thread(target=slot, args=(s,)) for s in sandboxes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    with lock:
+        failed = state['failed']
+    ## only the errors of the testcases after the first failed one don't matter
+    for index, e in errors:
+        if failed is None or not fail_fast or index is None or index < failed:
+            raise e
+
+    if not fail_fast:
+        return check_result(log_dir, output_dir, time_limit, space_limit, check_mode, digests)
+    if failures:
+        index = min(failures)
+        return failures[index], "testcase: %s" % testcases[index]
+    return JudgementStatusType.Accepted, None
 
-        ## check time limit and space limit
-        st = check_stat(code_stat_fp, time_limit, space_limit)
-        if st is not None:
-            return st, "testcase: %s" % testcase
 
-        ## check runtime error
-        st = check_error(code_error_fp)
-        if st is not None:
-            return st, "testcase: %s" % testcase
 
-        ## check output
-        st = check_output(code_output_fp, desired_output_fp)
+def check_result(log_dir, output_dir, time_limit, space_limit, check_mode, digests):
+    ## every testcase is checked, the status is the first failed one's and the reason has the verdict of each
+    verdicts = []
+    for testcase in sorted([tc for tc in os.listdir(output_dir)]):
+        st = check_testcase(log_dir, output_dir, testcase, time_limit, space_limit, check_mode, digests)
         if st is not None:
-            return st, "testcase: %s" % testcase
+            verdicts.append((testcase, st))
 
-    return JudgementStatusType.Accepted, None
+    if not verdicts:
+        return JudgementStatusType.Accepted, None
+    return verdicts[0][1], "testcases: %s" % ", ".join("%s %s" % (tc, st.name) for tc, st in verdicts)
 
 
-def check_compilation(compile_error_fp):
-    if os.stat(compile_error_fp).st_size != 0:
-        return JudgementStatusType.CompileError
-    return None
+def check_testcase(log_dir, output_dir, testcase, time_limit, space_limit, check_mode, digests):
+    desired_output_fp = os.path.join(output_dir, testcase)
+    code_output_fp = "%s.out" % os.path.join(log_dir, testcase)
+    code_error_fp = "%s.err" % os.path.join(log_dir, testcase)
+    code_stat_fp = "%s.stt" % os.path.join(log_dir, testcase)
 
+    if not os.path.exists(code_error_fp):
+        return None
 
-def check_stat(code_stat_fp, time_limit, space_limit):
-    stat = open(code_stat_fp).read()
+    stat = read_stat(code_stat_fp)
 
-    time = re.search('(Elapsed \(wall clock\) time \(h:mm:ss or m:ss\): )(.*)\n', stat).group(2)
-    time = float(time.split(':')[0]) * 60 + float(time.split(':')[1])
+    ## check time limit and space limit
+    st = check_stat(stat, time_limit, space_limit)
+    if st is not None:
+        return st
 
-    space = re.search('(Maximum resident set size \(kbytes\): )(.*)\n', stat).group(2)
-    space = float(space) / 1000.
+    ## check output limit (the sandbox stops the program right after the limit)
+    st = check_output_size(code_output_fp)
+    if st is not None:
+        return st
 
-    if time >= time_limit:
+    ## check runtime error
+    st = check_error(stat, code_error_fp)
+    if st is not None:
+        return st
+
+    ## check output
+    return check_output(code_output_fp, desired_output_fp, check_mode, digests.get(testcase))
+
+
+def read_stat(code_stat_fp):
+    ## main.sh writes one "key=value" line per field, other lines are gnu time messages
+    record = {}
+    with open(code_stat_fp) as f:
+        for line in f:
+            key, sep, value = line.strip().partition('=')
+            if sep:
+                record[key] = value
+
+    return dict(
+        wall_time = float(record.get('wall', 0)),
+        cpu_time = float(record.get('user', 0)) + float(record.get('sys', 0)),
+        space = int(record.get('rss_kb', 0)) / 1024.,
+        exit_code = int(record.get('exit', 0)),
+        signal = int(record.get('signal', 0)),
+        timeout = record.get('timeout') == '1',
+        oom = record.get('oom') == '1'
+    )
+
+
+def check_stat(stat, time_limit, space_limit):
+    if stat['timeout'] or stat['cpu_time'] >= time_limit or stat['wall_time'] >= time_limit:
         return JudgementStatusType.TimeExceeded
-    if space >= space_limit:
+    if stat['oom'] or stat['space'] >= space_limit:
         return JudgementStatusType.SpaceExceeded
     return None
 
 
-def check_error(code_error_fp):
-    if os.stat(code_error_fp).st_size != 0:
+def check_error(stat, code_error_fp):
+    if stat['exit_code'] != 0 or os.stat(code_error_fp).st_size != 0:
         return JudgementStatusType.RuntimeError
     return None
 
 
-def check_output(code_output_fp, desired_output_fp):
-    output = open(code_output_fp).read()
-    desired_output = open(desired_output_fp).read()
+def check_output_size(code_output_fp):
+    if os.path.getsize(code_output_fp) > checker.OUTPUT_LIMIT:
+        return JudgementStatusType.OutputExceeded
+    return None
 
-    if len(output):
-        output = output[:-1] if output[-1] == '\n' else output
-    desired_output = desired_output.strip()
 
-    if output != desired_output:
+def check_output(code_output_fp, desired_output_fp, check_mode, desired_digest=None):
+    if not checker.compare(code_output_fp, desired_output_fp, check_mode, desired_digest):
         return JudgementStatusType.WrongAnswer
     return None
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import sys
+import pwd
+import json
+import time
+import uuid
+import errno
+import signal
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# project imports
+from .sandbox import Sandbox, SandboxBackend
+from . import checker
+
+
+COMPILE_TIME_LIMIT = 30
+PIDS_LIMIT = 128
+PATH = "/usr/local/bin:/usr/bin:/bin"
+## kept out of the package dir, where types.py would shadow the standard module
+EXEC_HELPER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'bin', 'local_exec.py')
+
+## directories of the app config which the programs never see
+HIDDEN_DIRS = [
+    'DATA_DIR', 'MEDIA_DIR', 'TEMP_DIR', 'TESTCASE_DIR', 'SUBMISSION_DIR', 'PROBLEM_DIR',
+    'JUDGE_POOL_DIR', 'JUDGE_LOCAL_DIR', 'JUDGE_COMPILE_CACHE_DIR', 'JUDGE_CPU_LOCK_DIR'
+]
+
+
+class LocalSandboxError(Exception):
+    pass
+
+
+
+class Cgroup(object):
+    """
+    A fresh memory cgroup for a single run, so its peak and oom counters start from zero.
+    Both the unified (v2) hierarchy and the v1 memory controller are supported.
+    """
+
+    def __init__(self, parent, space_limit):
+        self.path = os.path.join(parent, str(uuid.uuid4()))
+        self.v2 = os.path.exists(os.path.join(parent, 'cgroup.controllers'))
+        os.mkdir(self.path)
+
+        limit = str((space_limit + 10) * 1024 * 1024)
+        if self.v2:
+            self.write('memory.max', limit)
+            self.write('memory.swap.max', '0', optional=True)
+            ## the pids controller may not be enabled for the parent
+            self.pids_limited = self.write('pids.max', str(PIDS_LIMIT), optional=True)
+        else:
+            self.write('memory.limit_in_bytes', limit)
+            self.write('memory.memsw.limit_in_bytes', limit, optional=True)
+            self.pids_limited = False
+
+
+    def write(self, name, value, optional=False):
+        try:
+            with open(os.path.join(self.path, name), 'w') as f:
+                f.write(value)
+            return True
+        except IOError:
+            if not optional:
+                raise
+            return False
+
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read()
+        except IOError:
+            return ''
+
+
+    def peak_kb(self):
+        value = self.read('memory.peak' if self.v2 else 'memory.max_usage_in_bytes').strip()
+        return int(value) / 1024 if value.isdigit() else 0
+
+
+    def oom_killed(self):
+        for line in self.read('memory.events' if self.v2 else 'memory.oom_control').splitlines():
+            key, _, value = line.partition(' ')
+            if key == 'oom_kill':
+                return int(value) > 0
+        return False
+
+
+    def kill(self):
+        ## cgroup.kill is only in newer kernels
+        if self.v2 and self.write('cgroup.kill', '1', optional=True):
+            return
+        for pid in self.read('cgroup.procs').split():
+            try:
+                os.kill(int(pid), signal.SIGKILL)
+            except OSError:
+                pass
+
+
+    def remove(self):
+        for _ in range(10):
+            try:
+                os.rmdir(self.path)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    return
+                time.sleep(0.01)
+
+
+
+class LocalSandbox(Sandbox):
+    def __init__(self, backend, prog_lang, cpu, space_limit):
+        super(LocalSandbox, self).__init__(os.path.join(backend.work_dir, prog_lang, str(uuid.uuid4())), prog_lang)
+        self.backend = backend
+        self.cpu = cpu
+        self.space_limit = space_limit
+        self.process = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+
+    def prepare(self, code_path):
+        super(LocalSandbox, self).prepare(code_path)
+        ## the workspace, the code and the logs stay root's, since root writes the logs and the program could
+        ## plant symlinks in a dir it owns; the program writes only into the scratch dir and the compiled dir
+        for name in ['', 'log']:
+            os.chmod(self.host_path(name), 0755)
+        os.chmod(self.host_path(self.code_filename), 0644)
+
+
+    def compile(self, artifact_dir):
+        compiled_dir = self.host_path("artifact", "compiled")
+        os.makedirs(compiled_dir)
+        os.chmod(self.host_path("artifact"), 0755)
+        os.chown(compiled_dir, self.backend.user.pw_uid, self.backend.user.pw_gid)
+
+        env = self.environment(compiled_dir)
+        error_fp = self.host_path("artifact", "compile.err")
+        with open(os.devnull, 'rb') as stdin, open(os.devnull, 'wb') as stdout, create_file(error_fp) as stderr:
+            stat = self.execute(["/bin/bash", os.path.join(self.pl_script_dir, "compile.sh")], env, stdin, stdout,
+                                stderr, COMPILE_TIME_LIMIT)
+
+        ## a failed compile is never cached as a successful one, even when it wrote nothing
+        if stat['timeout']:
+            with open(error_fp, 'ab') as f:
+                f.write("\nCompilation time limit exceeded (%s seconds)\n" % COMPILE_TIME_LIMIT)
+        elif stat['exit'] != 0 and os.path.getsize(error_fp) == 0:
+            with open(error_fp, 'wb') as f:
+                f.write("Compilation failed (exit code %s)\n" % stat['exit'])
+
+        ## the compiled files go into the cache, nothing of them stays the judge user's
+        for root, dirnames, filenames in os.walk(compiled_dir):
+            for name in dirnames + filenames:
+                os.lchown(os.path.join(root, name), 0, 0)
+        os.chown(compiled_dir, 0, 0)
+        for name in os.listdir(self.host_path("artifact")):
+            shutil.move(self.host_path("artifact", name), artifact_dir)
+
+
+    def run_testcase(self, compiled_dir, input_dir, testcase, time_limit):
+        if self.compiled_dir != compiled_dir:
+            self.install(compiled_dir)
+
+        log_fp = self.host_path("log", testcase)
+        env = self.environment(self.host_path("compiled"))
+        with open(os.path.join(input_dir, testcase), 'rb') as stdin, create_file("%s.out" % log_fp) as stdout, \
+                create_file("%s.err" % log_fp) as stderr:
+            stat = self.execute(["/bin/bash", os.path.join(self.pl_script_dir, "run.sh")], env, stdin, stdout, stderr,
+                                time_limit, self.space_limit)
+
+        with create_file("%s.stt" % log_fp) as f:
+            for key in ['wall', 'user', 'sys', 'rss_kb', 'exit', 'signal', 'timeout', 'oom']:
+                f.write("%s=%s\n" % (key, stat[key]))
+
+
+    def environment(self, compiled_dir):
+        return {
+            "PATH": PATH,
+            "HOME": self.host_path("scratch"),
+            "CODE_PATH": self.host_path(self.code_filename),
+            "COMPILED_DIR": compiled_dir
+        }
+
+
+    def execute(self, cmd, env, stdin, stdout, stderr, time_limit, space_limit=None):
+        ## memory is limited only for the runs (by a cgroup, or RLIMIT_AS without one)
+        cgroup = Cgroup(self.backend.cgroup, space_limit) if space_limit and self.backend.cgroup else None
+        error_fp = "%s.exec" % self.workspace
+        options = dict(
+            workspace = self.workspace,
+            cwd = self.host_path("scratch"),
+            hidden_dirs = self.backend.hidden_dirs,
+            cpu = self.cpu,
+            uid = self.backend.user.pw_uid,
+            gid = self.backend.user.pw_gid,
+            cgroup = cgroup.path if cgroup else None,
+            rlimits = self.rlimits(time_limit, space_limit, cgroup),
+            error_fp = error_fp
+        )
+        cmd = [sys.executable, '-S', '-E', EXEC_HELPER, json.dumps(options)] + cmd
+
+        timer = None
+        timed_out = []
+        try:
+            self.reset_scratch()
+            with self._lock:
+                if self._stopped:
+                    raise LocalSandboxError("sandbox is stopped")
+                start = time.time()
+                self.process = subprocess.Popen(
+                    cmd,
+                    stdin = stdin,
+                    stdout = stdout,
+                    stderr = stderr,
+                    cwd = self.workspace,
+                    env = env,
+                    close_fds = True
+                )
+
+            def kill():
+                timed_out.append(True)
+                self.kill()
+            timer = threading.Timer(time_limit, kill)
+            timer.start()
+
+            _, status, rusage = os.wait4(self.process.pid, 0)
+            wall = time.time() - start
+            self.process.returncode = status
+            peak_kb = cgroup.peak_kb() if cgroup else 0
+            oom = cgroup.oom_killed() if cgroup else False
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if self.process is not None:
+                self.kill()
+                self.process = None
+            if cgroup is not None:
+                cgroup.kill()
+                cgroup.remove()
+            error = self.read_error(error_fp)
+
+        if error:
+            raise LocalSandboxError("sandbox setup failed: %s" % error)
+
+        if os.WIFSIGNALED(status):
+            exit_code = 128 + os.WTERMSIG(status)
+        else:
+            exit_code = os.WEXITSTATUS(status)
+
+        return dict(
+            wall = "%.2f" % wall,
+            user = "%.2f" % rusage.ru_utime,
+            sys = "%.2f" % rusage.ru_stime,
+            rss_kb = max(rusage.ru_maxrss, peak_kb),
+            exit = exit_code,
+            signal = exit_code - 128 if exit_code > 128 else 0,
+            timeout = 1 if timed_out else 0,
+            oom = 1 if oom else 0
+        )
+
+
+    def reset_scratch(self):
+        ## every run starts with an empty scratch dir, which is its cwd and home
+        scratch = self.host_path("scratch")
+        shutil.rmtree(scratch, ignore_errors=True)
+        os.mkdir(scratch, 0700)
+        os.chown(scratch, self.backend.user.pw_uid, self.backend.user.pw_gid)
+
+
+    def rlimits(self, time_limit, space_limit, cgroup):
+        cpu_limit = int(time_limit) + 1
+        output_limit = (checker.OUTPUT_LIMIT / 1024 + 1) * 1024
+        rlimits = [
+            ('RLIMIT_CPU', cpu_limit, cpu_limit + 1),
+            ('RLIMIT_FSIZE', output_limit, output_limit),
+            ('RLIMIT_CORE', 0, 0)
+        ]
+
+        ## fallbacks when there is no cgroup (or no pids controller): the address space of each process,
+        ## and the processes of the judge user, which are shared by all the sandboxes of the host
+        if space_limit and cgroup is None:
+            as_limit = (space_limit + 10) * 1024 * 1024
+            rlimits.append(('RLIMIT_AS', as_limit, as_limit))
+        if cgroup is None or not cgroup.pids_limited:
+            nproc = PIDS_LIMIT * len(self.backend.cpus)
+            rlimits.append(('RLIMIT_NPROC', nproc, nproc))
+        return rlimits
+
+
+    @staticmethod
+    def read_error(error_fp):
+        try:
+            with open(error_fp) as f:
+                return f.read()
+        except IOError:
+            return None
+        finally:
+            if os.path.exists(error_fp):
+                os.remove(error_fp)
+
+
+    def kill(self):
+        ## the helper kills the pid namespace of the run, every process of the program dies with it
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        try:
+            os.kill(process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        self.kill()
+
+
+    def cleanup(self):
+        self._stopped = False
+        super(LocalSandbox, self).cleanup()
+        return True
+
+
+
+def create_file(path):
+    ## the dirs of the files which root writes are never the judge user's, the flags are a second guard
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0644)
+    return os.fdopen(fd, 'wb')
+
+
+
+class LocalBackend(SandboxBackend):
+    """
+    Runs the programs as plain processes on the worker host, without docker.
+    Every command is exec'd through local_exec.py, which puts it in new mount, pid, network, ipc and uts
+    namespaces with the data dirs hidden, pins it to its cpu, sets the rlimits and drops to JUDGE_LOCAL_USER.
+    Memory and processes are limited by a cgroup per run if JUDGE_LOCAL_CGROUP is set, otherwise
+    by RLIMIT_AS and RLIMIT_NPROC (programs which reserve a large address space, like java, need the cgroup).
+    The worker has to run as root, the backend refuses to judge otherwise.
+    """
+    name = 'local'
+
+    def init_app(self, app):
+        super(LocalBackend, self).init_app(app)
+        self.work_dir = app.config['JUDGE_LOCAL_DIR']
+        self.cgroup = app.config['JUDGE_LOCAL_CGROUP']
+        self.concurrency = min(self.concurrency, len(self.cpus))
+        self.lease_timeout = app.config['JUDGE_POOL_LEASE_TIMEOUT']
+
+        ## dropping privileges is only possible for root
+        username = app.config['JUDGE_LOCAL_USER']
+        self.user = None
+        if self.enabled and username and os.geteuid() == 0:
+            self.user = pwd.getpwnam(username)
+
+        ## nested dirs can't be mounted over once their parent is hidden
+        dirs = sorted(set(os.path.realpath(app.config[name]) for name in HIDDEN_DIRS if app.config.get(name)))
+        self.hidden_dirs = []
+        for path in dirs:
+            if os.path.isdir(path) and not any(path.startswith(d + os.sep) for d in self.hidden_dirs):
+                self.hidden_dirs.append(path)
+
+
+    @contextmanager
+    def lease(self, prog_lang, space_limit, count=1):
+        if self.user is None:
+            raise LocalSandboxError("The local backend needs a root worker and JUDGE_LOCAL_USER to drop privileges")
+
+        cpus = self.cpu_set.acquire(count, self.lease_timeout)
+        if not cpus:
+            raise LocalSandboxError("No cpu is available")
+
+        sandboxes = []
+        try:
+            for cpu in cpus:
+                sandboxes.append(LocalSandbox(self, prog_lang, cpu, space_limit))
+            yield sandboxes
+        finally:
+            for sandbox in sandboxes:
+                sandbox.stop()
+                sandbox.destroy()
+            self.cpu_set.release(cpus)
@@ -3,11 +3,20 @@
 echo "hello!!!"
 set -e
 
-export COMPILED_DIR="/tmp/compiled"
+# JUDGE_MODE: "compile" compiles the code into COMPILED_DIR,
+# "run" runs the TESTCASE input file of TESTCASE_DIR against an already compiled COMPILED_DIR
 
+if [ "$JUDGE_MODE" != "compile" ] && [ "$JUDGE_MODE" != "run" ]; then
+	echo "please export JUDGE_MODE environmet (compile or run)"
+	exit 1
+fi
 
-if [ ! -d "$COMPILED_DIR" ]; then
-	mkdir "$COMPILED_DIR"
+if [ -z "$COMPILED_DIR" ]; then
+	export COMPILED_DIR="/tmp/compiled"
+fi
+
+if [ "$JUDGE_MODE" = "compile" ] && [ ! -d "$COMPILED_DIR" ]; then
+	mkdir -p "$COMPILED_DIR"
 fi
 
 if [ -z "$CODE_PATH" ]; then
@@ -15,8 +24,8 @@ if [ -z "$CODE_PATH" ]; then
 	exit 1
 fi
 
-if [ -z "$TESTCASE_DIR" ]; then
-	echo "please export TESTCASE_DIR files directory"
+if [ "$JUDGE_MODE" = "run" ] && ( [ -z "$TESTCASE_DIR" ] || [ -z "$TESTCASE" ] ); then
+	echo "please export TESTCASE_DIR files directory and TESTCASE"
 	exit 1
 fi
 
@@ -28,26 +37,63 @@ if [ ! -d "$LOG_DIR" ]; then
 		mkdir "$LOG_DIR"
 	fi
 
+# prints the number of oom kills of the container cgroup (0 if it's not available)
+oom_kills() {
+	for f in /sys/fs/cgroup/memory.events /sys/fs/cgroup/memory/memory.oom_control; do
+		if [ -r "$f" ]; then
+			N=$(awk '$1 == "oom_kill" { print $2; exit }' "$f")
+			echo "${N:-0}"
+			return
+		fi
+	done
+	echo 0
+}
+
 echo "begin compiling"
 
 
 if [ -s "$CODE_PATH" ]; then
 
-	/bin/bash "$PL_SCRIPT_DIR/compile.sh" 2> "$LOG_DIR/compile.err"
+	if [ "$JUDGE_MODE" = "compile" ]; then
+		/bin/bash "$PL_SCRIPT_DIR/compile.sh" 2> "$LOG_DIR/compile.err"
+		echo "compiled successfully"
+	fi
 
-	echo "compiled successfully"
-	echo "begin tests"
+	if [ "$JUDGE_MODE" = "run" ]; then
+		echo "begin tests"
 
-	for tc in "$TESTCASE_DIR"/*
-	do
+		tc="$TESTCASE_DIR/$TESTCASE"
 		if [ -s "$tc" ]; then
 			NAME="$(basename $tc)"
 			ulimit -s hard
-			/usr/bin/time -v -o "$LOG_DIR/$NAME.stt" runuser -u restricted_user timeout "$TIME_LIMIT"s \
-				/bin/bash "$PL_SCRIPT_DIR/run.sh" < "$tc" 1> "$LOG_DIR/$NAME.out" 2> "$LOG_DIR/$NAME.err"
+			if [ -n "$OUTPUT_LIMIT" ]; then
+				ulimit -f $(( OUTPUT_LIMIT / 1024 + 1 ))
+			fi
+
+			OOM_KILLS=$(oom_kills)
+			EXIT=0
+			/usr/bin/time -f "wall=%e\nuser=%U\nsys=%S\nrss_kb=%M" -o "$LOG_DIR/$NAME.stt" \
+				runuser -u restricted_user timeout "$TIME_LIMIT"s \
+				/bin/bash "$PL_SCRIPT_DIR/run.sh" < "$tc" 1> "$LOG_DIR/$NAME.out" 2> "$LOG_DIR/$NAME.err" || EXIT=$?
+
+			SIGNAL=0
+			TIMEOUT=0
+			if [ "$EXIT" -eq 124 ]; then
+				TIMEOUT=1
+				SIGNAL=15
+			elif [ "$EXIT" -gt 128 ]; then
+				SIGNAL=$(( EXIT - 128 ))
+			fi
+
+			OOM=0
+			if [ "$(oom_kills)" -gt "$OOM_KILLS" ]; then
+				OOM=1
+			fi
+
+			echo -e "exit=$EXIT\nsignal=$SIGNAL\ntimeout=$TIMEOUT\noom=$OOM" >> "$LOG_DIR/$NAME.stt"
 		fi
-	done
-	echo "end of tests"
+		echo "end of tests"
+	fi
 
 else
 	echo "there is nothing for compile"
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import json
+import hashlib
+
+# project imports
+from . import checker
+
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def build_manifest(testcase_dir):
+    input_dir = os.path.join(testcase_dir, 'inputs')
+    output_dir = os.path.join(testcase_dir, 'outputs')
+
+    testcases = {}
+    version = hashlib.sha1()
+    for testcase in sorted(os.listdir(output_dir) if os.path.isdir(output_dir) else []):
+        input_fp = os.path.join(input_dir, testcase)
+        output_fp = os.path.join(output_dir, testcase)
+
+        data = checker.digest(output_fp)
+        if os.path.exists(input_fp):
+            data['input_size'] = os.path.getsize(input_fp)
+            data['input_sha1'] = checker.prefix_sha1(input_fp, data['input_size'])
+        else:
+            data['input_size'] = data['input_sha1'] = None
+
+        testcases[testcase] = data
+        version.update("%s:%s:%s\n" % (testcase, data['input_sha1'], data['sha1']))
+
+    manifest = dict(
+        version = version.hexdigest(),
+        testcases = testcases
+    )
+    with open(os.path.join(testcase_dir, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_manifest(testcase_dir):
+    try:
+        with open(os.path.join(testcase_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
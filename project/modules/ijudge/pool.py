@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import errno
+import socket
+import shutil
+import threading
+import uuid
+import Queue
+from contextlib import contextmanager
+import docker
+
+# project imports
+from .sandbox import Sandbox, SandboxBackend
+from . import checker
+
+WORKSPACE_BIND = "/etc/data/work"
+PLSCRIPT_BIND = "/etc/data/plscript"
+MAIN_SCRIPT = "/var/judge/main.sh"
+POOL_LABEL = "ijudge.pool"
+OWNER_LABEL = "ijudge.pool.owner"
+WORKSPACE_LABEL = "ijudge.pool.workspace"
+
+## run before a container goes back to the pool, so nothing of a submission is left for the next one:
+## the processes of restricted_user and every file it could write
+CLEANUP_SCRIPT = """
+pkill -9 -u restricted_user
+for i in $(seq 50); do
+    pgrep -u restricted_user > /dev/null || break
+    sleep 0.1
+done
+if pgrep -u restricted_user > /dev/null; then
+    exit 1
+fi
+find /tmp /var/tmp /dev/shm /run/lock -mindepth 1 -delete
+find / -xdev -user restricted_user -delete
+"""
+
+
+class ContainerPoolError(Exception):
+    pass
+
+
+
+class PooledContainer(Sandbox):
+    def __init__(self, pool, prog_lang):
+        super(PooledContainer, self).__init__(os.path.join(pool.work_dir, prog_lang, str(uuid.uuid4())), prog_lang)
+        self.pool = pool
+        self.uses = 0
+
+        volumes = {
+            self.workspace: {
+                'bind': WORKSPACE_BIND,
+                'mode': 'rw'
+            },
+            self.pl_script_dir: {
+                'bind': PLSCRIPT_BIND,
+                'mode': 'ro'
+            }
+        }
+
+        self.container = pool.client.containers.run(
+            image = "ijudge",
+            command = ["sleep", "infinity"],
+            detach = True,
+            mem_swappiness = 0,
+            cpu_quota = 100000,
+            volumes = volumes,
+            labels = {
+                POOL_LABEL: prog_lang,
+                OWNER_LABEL: pool.owner,
+                WORKSPACE_LABEL: self.workspace
+            },
+            tmpfs = {
+                "/tmp": "rw,exec,nosuid,size=256m",
+                "/var/tmp": "rw,nosuid,size=64m"
+            }
+        )
+        self.cpu = None
+        self.space_limit = None
+
+
+    def bind_path(self, *paths):
+        return os.path.join(WORKSPACE_BIND, *paths)
+
+
+    def prepare(self, code_path):
+        super(PooledContainer, self).prepare(code_path)
+        ## only readable by root of the container, which redirects the input of the program
+        os.makedirs(self.host_path("input"))
+        os.chmod(self.host_path("input"), 0700)
+
+
+    def execute(self, cmd, env=None):
+        if env:
+            cmd = ["env"] + ["%s=%s" % (k, v) for k, v in env.items()] + cmd
+        api = self.pool.client.api
+        exec_id = api.exec_create(self.container.id, cmd)
+        output = api.exec_start(exec_id)
+        return api.exec_inspect(exec_id)['ExitCode'], output
+
+
+    def compile(self, artifact_dir):
+        env = {
+            "JUDGE_MODE": "compile",
+            "CODE_PATH": self.bind_path(self.code_filename),
+            "PL_SCRIPT_DIR": PLSCRIPT_BIND,
+            "COMPILED_DIR": self.bind_path("artifact", "compiled"),
+            "LOG_DIR": self.bind_path("artifact")
+        }
+        self.execute(["/bin/bash", MAIN_SCRIPT], env)
+
+        container_artifact_dir = self.host_path("artifact")
+        if os.path.exists(container_artifact_dir):
+            for name in os.listdir(container_artifact_dir):
+                shutil.move(os.path.join(container_artifact_dir, name), artifact_dir)
+
+
+    def run_testcase(self, compiled_dir, input_dir, testcase, time_limit):
+        if self.compiled_dir != compiled_dir:
+            self.install(compiled_dir)
+
+        ## the testcases aren't mounted (the outputs are there), only the current input is copied in
+        input_fp = self.host_path("input", testcase)
+        shutil.copy(os.path.join(input_dir, testcase), input_fp)
+        env = {
+            "JUDGE_MODE": "run",
+            "CODE_PATH": self.bind_path(self.code_filename),
+            "PL_SCRIPT_DIR": PLSCRIPT_BIND,
+            "COMPILED_DIR": self.bind_path("compiled"),
+            "TESTCASE_DIR": self.bind_path("input"),
+            "TESTCASE": testcase,
+            "LOG_DIR": self.bind_path("log"),
+            "TIME_LIMIT": time_limit,
+            "OUTPUT_LIMIT": checker.OUTPUT_LIMIT
+        }
+        try:
+            self.execute(["/bin/bash", MAIN_SCRIPT], env)
+        finally:
+            os.remove(input_fp)
+
+
+    def limit(self, cpu, space_limit):
+        ## containers are pinned to the cpu of each lease
+        options = {}
+        if self.cpu != cpu:
+            options['cpuset_cpus'] = str(cpu)
+        if self.space_limit != space_limit:
+            mem_limit = "%sMB" % (space_limit + 10)
+            options.update(mem_limit=mem_limit, memswap_limit=mem_limit)
+        if options:
+            self.container.update(**options)
+        self.cpu = cpu
+        self.space_limit = space_limit
+
+
+    def is_healthy(self):
+        try:
+            self.container.reload()
+        except docker.errors.APIError:
+            return False
+        return self.container.status == 'running'
+
+
+    def stop(self):
+        self.execute(["pkill", "-9", "-u", "restricted_user"])
+
+
+    def cleanup(self):
+        self.uses += 1
+        super(PooledContainer, self).cleanup()
+        exit_code, _ = self.execute(["/bin/bash", "-c", CLEANUP_SCRIPT])
+        return exit_code == 0
+
+
+    def destroy(self):
+        try:
+            self.container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+        super(PooledContainer, self).destroy()
+
+
+
+class ContainerPool(SandboxBackend):
+    name = 'docker'
+
+    def __init__(self, app=None):
+        self._client = None
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._created = {}
+        super(ContainerPool, self).__init__(app)
+
+
+    def init_app(self, app):
+        super(ContainerPool, self).init_app(app)
+        self.reuse = app.config['JUDGE_POOL_ENABLED']
+        self.size = app.config['JUDGE_POOL_SIZE']
+        self.max_uses = app.config['JUDGE_POOL_MAX_USES']
+        self.lease_timeout = app.config['JUDGE_POOL_LEASE_TIMEOUT']
+        self.concurrency = min(self.concurrency, self.size)
+        self.work_dir = app.config['JUDGE_POOL_DIR']
+
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+
+    @contextmanager
+    def lease(self, prog_lang, space_limit, count=1):
+        ## cpus are shared with the other workers of the host, so the running programs never compete for one
+        cpus = self.cpu_set.acquire(count, self.lease_timeout)
+        if not cpus:
+            raise ContainerPoolError("No cpu is available")
+
+        try:
+            containers = [self._acquire(prog_lang)]
+            try:
+                while len(containers) < len(cpus):
+                    container = self._acquire(prog_lang, block=False)
+                    if container is None:
+                        break
+                    containers.append(container)
+
+                self.cpu_set.release(cpus[len(containers):])
+                cpus = cpus[:len(containers)]
+                for container, cpu in zip(containers, cpus):
+                    container.limit(cpu, space_limit)
+                yield containers
+            except Exception:
+                for container in containers:
+                    self._discard(container)
+                raise
+            for container in containers:
+                self._release(container)
+        finally:
+            self.cpu_set.release(cpus)
+
+
+    @property
+    def owner(self):
+        return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+    def startup(self):
+        ## the containers of a crashed worker process of this host are never destroyed by its shutdown
+        host = socket.gethostname()
+        for container in self.client.containers.list(all=True, filters={'label': POOL_LABEL}):
+            owner_host, _, pid = container.labels.get(OWNER_LABEL, '').partition(':')
+            if owner_host == host and pid.isdigit() and is_alive(int(pid)):
+                continue
+            if owner_host and owner_host != host:
+                continue
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError:
+                continue
+            workspace = container.labels.get(WORKSPACE_LABEL)
+            if workspace and workspace.startswith(self.work_dir + os.sep):
+                shutil.rmtree(workspace, ignore_errors=True)
+
+
+    def shutdown(self):
+        with self._lock:
+            for prog_lang, idle in self._idle.items():
+                while not idle.empty():
+                    idle.get_nowait().destroy()
+                    self._created[prog_lang] -= 1
+
+
+    def _acquire(self, prog_lang, block=True):
+        with self._lock:
+            idle = self._idle.setdefault(prog_lang, Queue.Queue())
+            self._created.setdefault(prog_lang, 0)
+
+        while True:
+            try:
+                container = idle.get_nowait()
+            except Queue.Empty:
+                container = self._create(prog_lang)
+                if container is None:
+                    if not block:
+                        return None
+                    try:
+                        container = idle.get(timeout=self.lease_timeout)
+                    except Queue.Empty:
+                        raise ContainerPoolError("No %s container is available" % prog_lang)
+
+            if container.is_healthy():
+                return container
+            self._discard(container)
+
+
+    def _create(self, prog_lang):
+        with self._lock:
+            if self._created[prog_lang] >= self.size:
+                return None
+            self._created[prog_lang] += 1
+
+        try:
+            return PooledContainer(self, prog_lang)
+        except Exception:
+            with self._lock:
+                self._created[prog_lang] -= 1
+            raise
+
+
+    def _release(self, container):
+        try:
+            reusable = container.cleanup() and self.reuse and container.uses < self.max_uses
+        except Exception:
+            reusable = False
+
+        if reusable:
+            self._idle[container.prog_lang].put(container)
+        else:
+            self._discard(container)
+
+
+    def _discard(self, container):
+        container.destroy()
+        with self._lock:
+            self._created[container.prog_lang] -= 1
+
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import time
+import fcntl
+import shutil
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SCRIPTS_DIR = os.path.join(BASE_DIR, 'scripts')
+
+
+class Sandbox(object):
+    """
+    A judge slot with its own workspace directory.
+    Backends implement compile, run_testcase and stop; each testcase leaves
+    <testcase>.out, <testcase>.err and <testcase>.stt (the stat record) in the log dir.
+    """
+
+    def __init__(self, workspace, prog_lang):
+        self.workspace = workspace
+        self.prog_lang = prog_lang
+        self.code_filename = None
+        self.compiled_dir = None
+        os.makedirs(self.workspace)
+
+
+    @property
+    def pl_script_dir(self):
+        return os.path.join(SCRIPTS_DIR, self.prog_lang)
+
+
+    def host_path(self, *paths):
+        return os.path.join(self.workspace, *paths)
+
+
+    def prepare(self, code_path):
+        self.code_filename = os.path.basename(code_path)
+        shutil.copy(code_path, self.host_path(self.code_filename))
+        if not os.path.exists(self.host_path('log')):
+            os.makedirs(self.host_path('log'))
+
+
+    def compile(self, artifact_dir):
+        raise NotImplementedError()
+
+
+    def install(self, compiled_dir):
+        ## the compile cache isn't visible to the programs (it has the artifacts of every team),
+        ## the artifact of this submission is copied into the workspace without write permission for others;
+        ## symlinks are kept as they are, so they're resolved inside the sandbox instead of by the copy
+        shutil.copytree(compiled_dir, self.host_path("compiled"), symlinks=True)
+        for root, dirnames, filenames in os.walk(self.host_path("compiled")):
+            for name in dirnames + filenames:
+                path = os.path.join(root, name)
+                if not os.path.islink(path):
+                    os.chmod(path, os.stat(path).st_mode & ~0022)
+        self.compiled_dir = compiled_dir
+
+
+    def run_testcase(self, compiled_dir, input_dir, testcase, time_limit):
+        raise NotImplementedError()
+
+
+    def collect(self, testcase, log_dir):
+        for ext in ['out', 'err', 'stt']:
+            path = self.host_path('log', "%s.%s" % (testcase, ext))
+            if os.path.exists(path):
+                shutil.move(path, os.path.join(log_dir, "%s.%s" % (testcase, ext)))
+
+
+    def stop(self):
+        raise NotImplementedError()
+
+
+    def cleanup(self):
+        for name in os.listdir(self.workspace):
+            path = self.host_path(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        self.code_filename = None
+        self.compiled_dir = None
+
+
+    def destroy(self):
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+
+
+class CpuSet(object):
+    """
+    The judge cpus of the host, shared by all the worker processes. A cpu is held by an
+    exclusive flock on its lock file, so two sandboxes are never pinned to the same cpu
+    and the cpus of a crashed process are released.
+    """
+
+    def __init__(self, lock_dir, cpus):
+        self.lock_dir = lock_dir
+        self.cpus = list(cpus)
+        self._lock = threading.Lock()
+        self._held = {}
+
+
+    def acquire(self, count, timeout):
+        ## waits for one free cpu, then takes up to count of them
+        deadline = time.time() + timeout
+        cpu = self._try_acquire()
+        while cpu is None:
+            if time.time() >= deadline:
+                return []
+            time.sleep(0.05)
+            cpu = self._try_acquire()
+
+        cpus = [cpu]
+        while len(cpus) < count:
+            cpu = self._try_acquire()
+            if cpu is None:
+                break
+            cpus.append(cpu)
+        return cpus
+
+
+    def release(self, cpus):
+        with self._lock:
+            lock_files = [self._held.pop(cpu) for cpu in cpus]
+        for lock_file in lock_files:
+            lock_file.close()
+
+
+    def _try_acquire(self):
+        for cpu in self.cpus:
+            lock_file = open(os.path.join(self.lock_dir, "cpu%s.lock" % cpu), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock_file.close()
+                continue
+            with self._lock:
+                self._held[cpu] = lock_file
+            return cpu
+        return None
+
+
+
+class SandboxBackend(object):
+    name = None
+
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['JUDGE_BACKEND'] == self.name
+        self.cpus = app.config['JUDGE_CPUS'] or range(multiprocessing.cpu_count())
+        self.concurrency = max(1, app.config['JUDGE_CONCURRENCY'])
+        self.cpu_set = CpuSet(app.config['JUDGE_CPU_LOCK_DIR'], self.cpus)
+
+
+    @contextmanager
+    def lease(self, prog_lang, space_limit, count=1):
+        raise NotImplementedError()
+        yield
+
+
+    def startup(self):
+        pass
+
+
+    def shutdown(self):
+        pass
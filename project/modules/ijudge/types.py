@@ -14,6 +14,8 @@ class JudgementStatusType(Enum):
     RuntimeError = 6
     RestrictedFunction = 7
     ExtensionError = 8
+    OutputExceeded = 9
+    JudgeError = 10 # the judge kept failing, admins can rejudge it
 
 
 class ProgrammingLanguageType(Enum):
@@ -22,3 +24,10 @@ class ProgrammingLanguageType(Enum):
     Python27 = 2
     Python35 = 3
     Java8 = 4
+
+
+class CheckModeType(Enum):
+    Exact = 0
+    Trailing = 1
+    Token = 2
+    Float = 3
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+
+class JudgeQueues(object):
+    """
+    Judge tasks are routed to a queue by their kind, queues are listed in priority order.
+    The worker of each queue also consumes the more urgent queues (those come first),
+    so an idle test worker helps the contest queue but contest workers never run tests.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.queues = [name for name, _ in app.config['JUDGE_QUEUES']]
+        self.concurrency = dict(app.config['JUDGE_QUEUES'])
+        self.contest, self.test, self.rejudge = self.queues
+
+
+    def route(self, test, rejudge=False):
+        if rejudge:
+            return self.rejudge
+        return self.test if test else self.contest
+
+
+    def slots(self, queue):
+        ## concurrent tasks of a queue, the workers of less urgent queues help it too
+        index = self.queues.index(queue)
+        return sum(self.concurrency[q] for q in self.queues[index:])
+
+
+    def worker_options(self, queue=None):
+        ## the least urgent worker consumes every queue (and the default one for other tasks)
+        queue = queue or self.queues[-1]
+        if queue not in self.queues:
+            raise ValueError("Unknown judge queue: %s" % queue)
+
+        index = self.queues.index(queue)
+        queues = self.queues[:index + 1]
+        if index == len(self.queues) - 1:
+            queues.append(self.app.config['CELERY_DEFAULT_QUEUE'])
+
+        return dict(
+            queues = ",".join(queues),
+            concurrency = self.concurrency[queue],
+            hostname = "%s@%%h" % queue
+        )
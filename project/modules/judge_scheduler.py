@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import math
+import time
+
+
+PUSH_SCRIPT = """
+local p, cid, tid = ARGV[1], ARGV[2], ARGV[3]
+local teams = p .. 'teams:' .. cid
+redis.call('RPUSH', p .. 'subs:' .. cid .. ':' .. tid, ARGV[4])
+redis.call('HINCRBY', p .. 'sizes', cid, 1)
+redis.call('HSET', p .. 'weights', cid, ARGV[5])
+if not redis.call('ZSCORE', teams, tid) then
+    redis.call('ZADD', teams, redis.call('GET', p .. 'vtime:' .. cid) or 0, tid)
+end
+if not redis.call('ZSCORE', p .. 'contests', cid) then
+    redis.call('ZADD', p .. 'contests', redis.call('GET', p .. 'vtime') or 0, cid)
+end
+redis.call('HSET', ARGV[6], ARGV[4], ARGV[7])
+"""
+
+POP_SCRIPT = """
+local p = ARGV[1]
+local c = redis.call('ZRANGE', p .. 'contests', 0, 0, 'WITHSCORES')
+if #c == 0 then
+    return false
+end
+local cid, cpass = c[1], tonumber(c[2])
+local teams = p .. 'teams:' .. cid
+redis.call('SET', p .. 'vtime', cpass)
+
+local sid = false
+local t = redis.call('ZRANGE', teams, 0, 0, 'WITHSCORES')
+if #t > 0 then
+    local tid, tpass = t[1], tonumber(t[2])
+    local subs = p .. 'subs:' .. cid .. ':' .. tid
+    redis.call('SET', p .. 'vtime:' .. cid, tpass)
+    sid = redis.call('LPOP', subs)
+    if redis.call('LLEN', subs) == 0 then
+        redis.call('ZREM', teams, tid)
+    else
+        redis.call('ZADD', teams, tpass + 1, tid)
+    end
+end
+
+if redis.call('HINCRBY', p .. 'sizes', cid, -1) <= 0 or redis.call('ZCARD', teams) == 0 then
+    redis.call('ZREM', p .. 'contests', cid)
+    redis.call('HDEL', p .. 'sizes', cid)
+    redis.call('HDEL', p .. 'weights', cid)
+    redis.call('DEL', teams, p .. 'vtime:' .. cid)
+else
+    local weight = tonumber(redis.call('HGET', p .. 'weights', cid) or 1)
+    redis.call('ZADD', p .. 'contests', cpass + 1 / weight, cid)
+end
+if sid then
+    redis.call('ZADD', p .. 'inflight', ARGV[2], sid)
+    redis.call('HINCRBY', p .. 'attempts', sid, 1)
+end
+return sid
+"""
+
+
+class JudgeScheduler(object):
+    """
+    Weighted round-robin (stride scheduling) of the queued submissions of a judge queue,
+    first between contests and then between the teams of the chosen contest.
+    Celery tasks only carry a token, the submission is chosen when a worker is free.
+    Popped submissions stay in an in-flight set until they are acknowledged, the ones whose
+    lease has expired (their worker died) are returned by `expired` to be queued again.
+    The queue of each submission is kept until it's acknowledged.
+    """
+    prefix = 'judge:'
+    test_team = 'test'
+
+    def __init__(self, redis_connection, app=None):
+        self.redis = redis_connection
+        self.app = app
+        self._push = None
+        self._pop = None
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.smoothing = self.app.config['JUDGE_TIME_SMOOTHING']
+
+
+    def key(self, queue, *parts):
+        return "%s%s:%s" % (self.prefix, queue, ''.join(parts))
+
+
+    def push(self, queue, submission_obj):
+        if self._push is None:
+            self._push = self.redis.register_script(PUSH_SCRIPT)
+
+        contest_obj = submission_obj.contest
+        tid = str(submission_obj.team.pk) if submission_obj.team else self.test_team
+        self._push(args=[
+            self.key(queue),
+            str(contest_obj.pk),
+            tid,
+            str(submission_obj.pk),
+            max(1, contest_obj.judge_weight),
+            self.placed_key(),
+            queue
+        ])
+
+
+    def placed_key(self):
+        return "%splaced" % self.prefix
+
+
+    def queue_of(self, submission_obj):
+        return self.redis.hget(self.placed_key(), str(submission_obj.pk))
+
+
+    def pop(self, queue, lease):
+        if self._pop is None:
+            self._pop = self.redis.register_script(POP_SCRIPT)
+        return self._pop(args=[self.key(queue), time.time() + lease])
+
+
+    def ack(self, queue, sid):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.key(queue, 'inflight'), sid)
+        pipe.hdel(self.key(queue, 'attempts'), sid)
+        pipe.hdel(self.placed_key(), sid)
+        pipe.execute()
+
+
+    def release(self, queue, sid):
+        ## only one caller gets True for an in-flight submission
+        return self.redis.zrem(self.key(queue, 'inflight'), sid) == 1
+
+
+    def expired(self, queue):
+        sids = self.redis.zrangebyscore(self.key(queue, 'inflight'), '-inf', time.time())
+        return [sid for sid in sids if self.release(queue, sid)]
+
+
+    def attempts(self, queue, sid):
+        return int(self.redis.hget(self.key(queue, 'attempts'), sid) or 0)
+
+
+    def record_time(self, queue, seconds):
+        key = self.key(queue, 'avg_time')
+        average = self.redis.get(key)
+        if average is not None:
+            seconds = self.smoothing * seconds + (1 - self.smoothing) * float(average)
+        self.redis.set(key, seconds)
+
+
+    def position(self, queue, submission_obj):
+        """
+        Estimates how many submissions of the queue will be dispatched before this one,
+        returns None if the submission isn't queued.
+        """
+        cid = str(submission_obj.contest.pk)
+        tid = str(submission_obj.team.pk) if submission_obj.team else self.test_team
+        sid = str(submission_obj.pk)
+
+        subs = self.redis.lrange(self.key(queue, 'subs:', cid, ':', tid), 0, -1)
+        if sid not in subs:
+            return None
+        index = subs.index(sid)
+
+        ## picks of the contest before the submission, teams with a lower pass go first
+        teams = dict(self.redis.zrange(self.key(queue, 'teams:', cid), 0, -1, withscores=True))
+        contests = dict(self.redis.zrange(self.key(queue, 'contests'), 0, -1, withscores=True))
+        if tid not in teams or cid not in contests:
+            return None
+
+        target = teams[tid] + index
+        count = index
+        for other_tid, other_pass in teams.items():
+            if other_tid != tid:
+                size = self.redis.llen(self.key(queue, 'subs:', cid, ':', other_tid))
+                count += min(size, max(0, int(math.ceil(target - other_pass))))
+
+        ## picks of the other contests until the contest reaches that pass
+        sizes = self.redis.hgetall(self.key(queue, 'sizes'))
+        weights = self.redis.hgetall(self.key(queue, 'weights'))
+        target = contests[cid] + float(count) / int(weights.get(cid, 1))
+        position = count
+        for other_cid, other_pass in contests.items():
+            if other_cid != cid:
+                size = int(sizes.get(other_cid, 0))
+                weight = int(weights.get(other_cid, 1))
+                position += min(size, max(0, int(math.ceil((target - other_pass) * weight))))
+        return position
+
+
+    def expected_wait(self, queue, position, slots):
+        ## seconds until the verdict, submissions ahead are judged by `slots` workers at once
+        average = self.redis.get(self.key(queue, 'avg_time'))
+        if average is None:
+            return None
+        return (float(position) / max(1, slots) + 1) * float(average)
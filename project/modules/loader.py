@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+from collections import defaultdict
+from bson import DBRef
+from mongoengine.base import get_document
+
+# project imports
+from project.extensions import db
+
+
+def ref_id(value):
+    if isinstance(value, (db.Document, DBRef)):
+        return value.id
+    return value
+
+
+def field_id(doc, name):
+    ## id of a reference without dereferencing it
+    return ref_id(doc._data.get(name))
+
+
+def field_ids(doc, name):
+    return [ref_id(value) for value in doc._data.get(name) or []]
+
+
+
+class Loader(object):
+    """
+    Batched dereferencing for the json of many documents: the referenced ids are
+    collected first, then each collection is fetched once by a projected $in query.
+    Documents are kept as records (project.models.records) and looked up by id.
+    """
+
+    def __init__(self):
+        self._wanted = defaultdict(set)
+        self._records = defaultdict(dict)
+
+
+    def want(self, record, ids):
+        self._wanted[record].update(i for i in ids if i is not None and i not in self._records[record])
+        return self
+
+
+    def load(self):
+        for record, ids in self._wanted.items():
+            if not ids:
+                continue
+            model = get_document(record.document)
+            for doc in record.query(model.objects(pk__in=list(ids))):
+                self._records[record][doc['_id']] = record(doc)
+        self._wanted.clear()
+        return self
+
+
+    def get(self, record, id):
+        return self._records[record].get(id)
+
+
+    def get_list(self, record, ids):
+        ## in the order of ids, missing documents are skipped
+        records = [self.get(record, i) for i in ids]
+        return [r for r in records if r is not None]
@@ -3,19 +3,28 @@ __author__ = 'AminHP'
 
 # python imports
 import json as pyjson
+import base64
+import hashlib
 from functools import wraps
 from cStringIO import StringIO as IO
+from bson import json_util
 
 # flask imports
-from flask import request, url_for, jsonify
+from flask import request, url_for, jsonify, abort
 from flask.ext.mongoengine.pagination import Pagination
 
 # project imports
 from project import app
-from project.extensions import db
+from project.extensions import db, cache
 
 
-def paginate(key, max_per_page, **pkwargs):
+def paginate(key, max_per_page, order=None, count=True, bulk=False, **pkwargs):
+    """
+    Pages by page number, or by cursor when `order` (the sort fields ending with a unique one)
+    is given and the request has a cursor parameter (empty for the first page). Cursor pages are
+    keyset range scans, the total is cached for a short time (or omitted when count is False).
+    With bulk, result_func gets the items of the whole page (see modules.loader).
+    """
 
     def decorator(f):
         @wraps(f)
@@ -23,14 +32,22 @@ def paginate(key, max_per_page, **pkwargs):
             query, result_func = f(*args, **kwargs)
 
             page = request.args.get('page', 1, type=int)
-            per_page = min(
+            per_page = max(1, min(
                 request.args.get('per_page', app.config['DEFAULT_PAGE_SIZE'], type=int),
                 max_per_page
-            )
+            ))
 
             if not isinstance(query, db.QuerySet):
                 return f(*args, **kwargs)
 
+            if bulk:
+                page_func = result_func
+            else:
+                page_func = lambda items: [result_func(item) for item in items]
+
+            if order and 'cursor' in request.args:
+                return cursor_page(key, query, page_func, order, count, per_page, kwargs)
+
             pagination_obj = Pagination(query, page, per_page)
             meta = {
                 'page': pagination_obj.page,
@@ -78,10 +95,97 @@ def paginate(key, max_per_page, **pkwargs):
             )
 
             return jsonify({
-                str(key): [result_func(item) for item in pagination_obj.items],
+                str(key): page_func(pagination_obj.items),
                 'meta': meta
             })
 
         return wrapped
 
     return decorator
+
+
+def cursor_page(key, query, page_func, order, count, per_page, url_kwargs):
+    items, cursor = keyset_page(query, order, per_page, request.args.get('cursor'))
+    meta = {
+        'per_page': per_page,
+        'first': url_for(request.endpoint, cursor='', per_page=per_page, _external=True, **url_kwargs),
+        'next': None
+    }
+
+    if cursor:
+        meta['next'] = url_for(
+            request.endpoint,
+            cursor = cursor,
+            per_page = per_page,
+            _external = True,
+            **url_kwargs
+        )
+
+    if count:
+        meta['total'] = cached_count(query)
+
+    return jsonify({
+        str(key): page_func(items),
+        'meta': meta
+    })
+
+
+def cached_count(query):
+    ## the same filter counts once per PAGINATE_COUNT_TIMEOUT
+    filters = json_util.dumps(query._query, sort_keys=True)
+    key = "paginate_count:%s:%s" % (query._document._get_collection_name(), hashlib.sha1(filters).hexdigest())
+    total = cache.get(key)
+    if total is None:
+        total = query.count()
+        cache.set(key, total, timeout=app.config['PAGINATE_COUNT_TIMEOUT'])
+    return total
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json_util.dumps(values))
+
+
+def decode_cursor(cursor):
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        return abort(400, "Cursor is invalid")
+
+
+def keyset_page(query, order, per_page, cursor=None):
+    """
+    Returns the page of a query (documents or as_pymongo) after the cursor and the cursor of the next page.
+    `order` lists the sort fields ('-' for descending) and ends with a unique one,
+    so a page costs an index range scan instead of skipping the previous pages.
+    """
+    document = query._document
+    names = [name.lstrip('-') for name in order]
+    keys = [
+        (document._fields[name].db_field, -1 if field.startswith('-') else 1)
+        for name, field in zip(names, order)
+    ]
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(keys):
+            return abort(400, "Cursor is invalid")
+
+        ## (a, b) after (x, y) means a after x, or a == x and b after y
+        conditions = []
+        for i, (key, direction) in enumerate(keys):
+            condition = dict((k, v) for (k, _), v in zip(keys[:i], values))
+            condition[key] = {'$lt' if direction < 0 else '$gt': values[i]}
+            conditions.append(condition)
+        query = query.filter(__raw__={'$or': conditions})
+
+    items = [item for item in query.order_by(*order).limit(per_page + 1)]
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        if isinstance(last, dict):
+            values = [last[key] for key, _ in keys]
+        else:
+            values = [getattr(last, name) for name in names]
+        next_cursor = encode_cursor(values)
+    return items, next_cursor
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+from bson import ObjectId
+
+# flask imports
+from flask import g
+
+# project imports
+from project.extensions import db
+from project.modules.loader import field_id, field_ids
+
+
+## permission checks of the current user (g.user_id) by ids,
+## references of the loaded documents are never dereferenced
+
+
+def user_id():
+    return ObjectId(g.user_id)
+
+
+def is_owner(doc):
+    return field_id(doc, 'owner') == user_id()
+
+
+def is_contest_admin(contest_obj):
+    ## owner or admin
+    return is_owner(contest_obj) or user_id() in field_ids(contest_obj, 'admins')
+
+
+def is_team_member(team_obj):
+    ## owner or member
+    return is_owner(team_obj) or user_id() in field_ids(team_obj, 'members')
+
+
+def user_team_ids():
+    ## teams of the current user, fetched once per request
+    if getattr(g, 'user_team_ids', None) is None:
+        from project.models.team import Team
+        uid = user_id()
+        teams = Team.objects.filter(db.Q(owner=uid) | db.Q(members=uid)).only('id').as_pymongo()
+        g.user_team_ids = set(t['_id'] for t in teams)
+    return g.user_team_ids
+
+
+def is_contest_member(contest_obj):
+    ## a member of an accepted team
+    return not user_team_ids().isdisjoint(field_ids(contest_obj, 'accepted_teams'))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import threading
+from functools import wraps
+from pymongo import monitoring
+
+# flask imports
+from flask import request
+
+
+class QueryCounter(monitoring.CommandListener):
+    def __init__(self):
+        self._local = threading.local()
+
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+    def reset(self):
+        self._local.count = 0
+
+
+    def started(self, event):
+        ## batches of a large result aren't separate queries
+        if event.command_name != 'getMore':
+            self._local.count = self.count + 1
+
+
+    def succeeded(self, event):
+        pass
+
+
+    def failed(self, event):
+        pass
+
+
+
+class QueryGuard(object):
+    """
+    Counts the mongo commands of each request (pymongo command monitoring).
+    Routes decorated with `limit` fail when they run more queries than their budget
+    if QUERY_GUARD_STRICT is set (testing), otherwise a warning is logged.
+    """
+
+    def __init__(self, app=None):
+        ## listeners only apply to clients created after registering
+        self.counter = QueryCounter()
+        monitoring.register(self.counter)
+        self.app = app
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.strict = self.app.config['QUERY_GUARD_STRICT']
+
+
+    def limit(self, max_queries):
+
+        def decorator(f):
+            @wraps(f)
+            def wrapped(*args, **kwargs):
+                self.counter.reset()
+                response = f(*args, **kwargs)
+
+                count = self.counter.count
+                if count > max_queries:
+                    message = "%s ran %s queries (limit is %s)" % (request.endpoint, count, max_queries)
+                    if self.strict:
+                        raise AssertionError(message)
+                    self.app.logger.warning(message)
+                return response
+
+            return wrapped
+
+        return decorator
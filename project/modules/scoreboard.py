@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import json
+import time
+from contextlib import contextmanager
+import gevent
+from gevent.queue import Queue, Full
+
+
+## score = penalty - solved_count * SOLVED_SCALE, so the ascending order of the sorted set is the ranking
+SOLVED_SCALE = 10 ** 9
+REBUILD_TIMEOUT = 3600 # seconds a recompute may take to read the submissions
+
+APPLY_FUNCTION = """
+local function apply(p, tid, pid, accepted, submitted_at, starts_at, penalty, scale)
+    local raw = redis.call('HGET', p .. 'teams', tid)
+    local team = raw and cjson.decode(raw) or {problems = {}, solved_count = 0, penalty = 0}
+    local problem = team.problems[pid] or {failed_tries = 0, penalty = 0, solved = false}
+    if problem.solved then
+        return nil
+    end
+
+    problem.submitted_at = submitted_at
+    if accepted then
+        problem.solved = true
+        problem.penalty = problem.penalty + math.floor((submitted_at - starts_at) / 60)
+        team.solved_count = team.solved_count + 1
+        team.penalty = team.penalty + problem.penalty
+    else
+        problem.failed_tries = problem.failed_tries + 1
+        problem.penalty = problem.penalty + penalty
+    end
+    team.problems[pid] = problem
+
+    redis.call('HSET', p .. 'teams', tid, cjson.encode(team))
+    redis.call('ZADD', p .. 'rank', team.penalty - team.solved_count * scale, tid)
+    return team
+end
+"""
+
+UPDATE_SCRIPT = APPLY_FUNCTION + """
+local p, tid, pid = ARGV[1], ARGV[2], ARGV[3]
+if redis.call('EXISTS', p .. 'version') == 0 then
+    return -1
+end
+
+-- the verdict is replayed onto the scoreboard which is being rebuilt
+if redis.call('EXISTS', p .. 'rebuild') == 1 then
+    redis.call('RPUSH', p .. 'replay', cjson.encode({ARGV[11], tid, pid, ARGV[4], ARGV[5]}))
+end
+
+local team = apply(p, tid, pid, ARGV[4] == '1', tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8]))
+if not team then
+    return 0
+end
+local version = redis.call('INCR', p .. 'version')
+
+local delta = cjson.encode({version = version, team_id = tid, team = team, rank = redis.call('ZRANK', p .. 'rank', tid)})
+redis.call('RPUSH', p .. 'deltas', delta)
+redis.call('LTRIM', p .. 'deltas', -tonumber(ARGV[10]), -1)
+redis.call('PUBLISH', p .. 'events', delta)
+
+for _, name in ipairs({'teams', 'rank', 'version', 'deltas'}) do
+    redis.call('EXPIRE', p .. name, ARGV[9])
+end
+return version
+"""
+
+SEED_SCRIPT = """
+local p = ARGV[1]
+if redis.call('EXISTS', p .. 'version') == 1 then
+    return 0
+end
+redis.call('DEL', p .. 'deltas')
+for tid, team in pairs(cjson.decode(ARGV[2])) do
+    redis.call('HSET', p .. 'teams', tid, cjson.encode(team))
+    redis.call('ZADD', p .. 'rank', team.penalty - team.solved_count * tonumber(ARGV[3]), tid)
+end
+redis.call('SET', p .. 'version', ARGV[5])
+for _, name in ipairs({'teams', 'rank', 'version'}) do
+    redis.call('EXPIRE', p .. name, ARGV[4])
+end
+return 1
+"""
+
+## replaces the scoreboard with a recomputed one, then replays the verdicts which landed
+## during the recompute and aren't among its submissions
+REBUILD_SCRIPT = APPLY_FUNCTION + """
+local p, scale = ARGV[1], tonumber(ARGV[4])
+local read = {}
+for _, sid in ipairs(cjson.decode(ARGV[3])) do
+    read[sid] = true
+end
+local replay = redis.call('LRANGE', p .. 'replay', 0, -1)
+redis.call('DEL', p .. 'teams', p .. 'rank', p .. 'deltas', p .. 'replay', p .. 'rebuild')
+
+for tid, team in pairs(cjson.decode(ARGV[2])) do
+    redis.call('HSET', p .. 'teams', tid, cjson.encode(team))
+    redis.call('ZADD', p .. 'rank', team.penalty - team.solved_count * scale, tid)
+end
+for _, raw in ipairs(replay) do
+    local v = cjson.decode(raw)
+    if not read[v[1]] then
+        apply(p, v[2], v[3], v[4] == '1', tonumber(v[5]), tonumber(ARGV[5]), tonumber(ARGV[6]), scale)
+    end
+end
+
+local version = redis.call('GET', p .. 'version')
+if version and tonumber(version) >= tonumber(ARGV[7]) then
+    redis.call('INCR', p .. 'version')
+else
+    redis.call('SET', p .. 'version', ARGV[7])
+end
+for _, name in ipairs({'teams', 'rank', 'version'}) do
+    redis.call('EXPIRE', p .. name, ARGV[8])
+end
+redis.call('PUBLISH', p .. 'events', cjson.encode({reset = true}))
+return {redis.call('HGETALL', p .. 'teams'), redis.call('ZRANGE', p .. 'rank', 0, -1)}
+"""
+
+
+class EventChannel(object):
+    """
+    The events of a contest for the streams of this process: one redis subscription
+    whose messages are put into the queue of each stream.
+    """
+
+    def __init__(self, redis_connection, name, size):
+        self.redis = redis_connection
+        self.name = name
+        self.size = size
+        self.queues = set()
+        self.pubsub = None
+        self.greenlet = None
+
+
+    def start(self):
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.name)
+        self.greenlet = gevent.spawn(self.run)
+
+
+    def run(self):
+        while True:
+            try:
+                for message in self.pubsub.listen():
+                    if message['type'] == 'message':
+                        self.broadcast(json.loads(message['data']))
+            except Exception:
+                ## events may be lost while reconnecting, the streams start over from a snapshot
+                self.broadcast(dict(reset=True))
+                gevent.sleep(1)
+
+
+    def broadcast(self, event):
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(event)
+            except Full:
+                ## a stream which doesn't keep up starts over from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(dict(reset=True))
+
+
+    def add(self):
+        queue = Queue(self.size)
+        self.queues.add(queue)
+        return queue
+
+
+    def remove(self, queue):
+        self.queues.discard(queue)
+
+
+    def close(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+        if self.pubsub is not None:
+            self.pubsub.close()
+
+
+
+class Scoreboard(object):
+    """
+    Live contest results in redis: a hash of the team data and a sorted set of the ranking,
+    so a verdict is applied in O(log n). Mongo Result is the durable copy which is
+    persisted asynchronously and seeds redis when the keys don't exist.
+    Every update is published as a delta (the team row and its rank) on the events channel
+    and the recent deltas are kept, so streams can resume from a version.
+    The streams of a contest in a process share one subscription (see EventChannel).
+    """
+    prefix = 'scoreboard:'
+
+    def __init__(self, redis_connection, app=None):
+        self.redis = redis_connection
+        self.app = app
+        self._update = None
+        self._seed = None
+        self._rebuild = None
+        self._channels = {}
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.timeout = self.app.config['SCOREBOARD_TIMEOUT']
+        self.persist_delay = self.app.config['SCOREBOARD_PERSIST_DELAY']
+        self.history = self.app.config['SCOREBOARD_DELTA_HISTORY']
+
+
+    def key(self, cid, name=''):
+        return "%s%s:%s" % (self.prefix, cid, name)
+
+
+    def update(self, contest_obj, sid, tid, pid, accepted, submitted_at, penalty=20):
+        if self._update is None:
+            self._update = self.redis.register_script(UPDATE_SCRIPT)
+
+        args = [
+            self.key(contest_obj.pk),
+            tid,
+            pid,
+            1 if accepted else 0,
+            submitted_at,
+            contest_obj.starts_at,
+            penalty,
+            SOLVED_SCALE,
+            self.timeout,
+            self.history,
+            sid
+        ]
+        version = self._update(args=args)
+        if version == -1:
+            self.seed(contest_obj)
+            version = self._update(args=args)
+        return version
+
+
+    def seed(self, contest_obj):
+        if self._seed is None:
+            self._seed = self.redis.register_script(SEED_SCRIPT)
+        teams = contest_obj.result.teams if contest_obj.result else {}
+        ## versions start from the time in milliseconds, so they never repeat after a reseed
+        version = int(time.time() * 1000)
+        self._seed(args=[self.key(contest_obj.pk), json.dumps(teams), SOLVED_SCALE, self.timeout, version])
+
+
+    def load(self, contest_obj):
+        pipe = self.redis.pipeline()
+        pipe.get(self.key(contest_obj.pk, 'version'))
+        pipe.hgetall(self.key(contest_obj.pk, 'teams'))
+        pipe.zrange(self.key(contest_obj.pk, 'rank'), 0, -1)
+        version, teams, sorted_team_ids = pipe.execute()
+
+        if version is None:
+            self.seed(contest_obj)
+            return self.load(contest_obj)
+
+        teams = dict((tid, json.loads(team)) for tid, team in teams.items())
+        return teams, sorted_team_ids, int(version)
+
+
+    def version(self, contest_obj):
+        version = self.redis.get(self.key(contest_obj.pk, 'version'))
+        if version is None:
+            self.seed(contest_obj)
+            return self.version(contest_obj)
+        return int(version)
+
+
+    def deltas_since(self, contest_obj, version):
+        ## returns None when the deltas after the version aren't kept anymore
+        current = self.version(contest_obj)
+        if version == current:
+            return []
+        if version > current:
+            return None
+
+        deltas = [json.loads(d) for d in self.redis.lrange(self.key(contest_obj.pk, 'deltas'), 0, -1)]
+        if not deltas or deltas[0]['version'] > version + 1:
+            return None
+        return [d for d in deltas if d['version'] > version]
+
+
+    @contextmanager
+    def listen(self, cid):
+        ## yields the queue of the events of the contest
+        channel = self._channels.get(cid)
+        if channel is None:
+            ## registered before subscribing (which switches greenlets), so the contest has one channel
+            channel = self._channels[cid] = EventChannel(self.redis, self.key(cid, 'events'), self.history)
+            try:
+                channel.start()
+            except Exception:
+                del self._channels[cid]
+                raise
+
+        queue = channel.add()
+        try:
+            yield queue
+        finally:
+            channel.remove(queue)
+            if not channel.queues and self._channels.get(cid) is channel:
+                del self._channels[cid]
+                channel.close()
+
+
+    def begin_rebuild(self, contest_obj):
+        ## verdicts from now on are recorded to be replayed by rebuild
+        pipe = self.redis.pipeline()
+        pipe.set(self.key(contest_obj.pk, 'rebuild'), 1, ex=REBUILD_TIMEOUT)
+        pipe.delete(self.key(contest_obj.pk, 'replay'))
+        pipe.execute()
+
+
+    def rebuild(self, contest_obj, teams, sids, penalty=20):
+        """
+        Replaces the live results with teams, recomputed from the submissions sids (read after begin_rebuild).
+        Returns the rebuilt teams and ranking, the live verdicts of the other submissions included.
+        """
+        if self._rebuild is None:
+            self._rebuild = self.redis.register_script(REBUILD_SCRIPT)
+
+        version = int(time.time() * 1000)
+        raw_teams, sorted_team_ids = self._rebuild(args=[
+            self.key(contest_obj.pk),
+            json.dumps(teams),
+            json.dumps(sids),
+            SOLVED_SCALE,
+            contest_obj.starts_at,
+            penalty,
+            version,
+            self.timeout
+        ])
+        teams = dict((raw_teams[i], json.loads(raw_teams[i + 1])) for i in range(0, len(raw_teams), 2))
+        return teams, sorted_team_ids
+
+
+    def claim_persist(self, cid):
+        ## at most one persisting task is waiting for each contest
+        return self.redis.set(self.key(cid, 'persist'), 1, nx=True, ex=self.persist_delay * 10)
+
+
+    def release_persist(self, cid):
+        self.redis.delete(self.key(cid, 'persist'))
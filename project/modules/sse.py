@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import json
+
+# flask imports
+from flask import Response, stream_with_context
+
+
+def sse_event(event, data, id=None):
+    lines = []
+    if id is not None:
+        lines.append("id: %s" % id)
+    lines.append("event: %s" % event)
+    lines.append("data: %s" % json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_comment(text):
+    return ": %s\n\n" % text
+
+
+def sse_response(generator):
+    response = Response(stream_with_context(generator), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    ## tells nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
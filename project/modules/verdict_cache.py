@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import os
+import json
+import time
+import hashlib
+
+
+class VerdictCache(object):
+    prefix = 'verdict:'
+
+    def __init__(self, redis_connection, app=None):
+        self.redis = redis_connection
+        self.app = app
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.timeout = self.app.config['VERDICT_CACHE_TIMEOUT']
+
+
+    def make_key(self, code_path, prog_lang, problem_obj):
+        ## testcase_version changes on every testcase upload, so old verdicts are never hit again
+        if not problem_obj.testcase_version:
+            return None
+
+        h = hashlib.sha1()
+        h.update(os.path.basename(code_path))
+        h.update(hashlib.sha1(open(code_path, 'rb').read()).digest())
+        h.update("%s:%s:%s:%s:%s" % (
+            prog_lang.name,
+            problem_obj.time_limit,
+            problem_obj.space_limit,
+            problem_obj.check_mode.name,
+            problem_obj.testcase_version
+        ))
+        return self.prefix + h.hexdigest()
+
+
+    def get(self, key, status_type, since=None):
+        ## verdicts judged before `since` are ignored (e.g. a rejudge after a judge fix)
+        if key is None:
+            return None
+        value = self.redis.get(key)
+        if not value:
+            return None
+        value = json.loads(value)
+        status, reason = value[:2]
+        judged_at = value[2] if len(value) > 2 else 0
+        if since is not None and judged_at < since:
+            return None
+        return status_type(status), reason
+
+
+    def set(self, key, status, reason):
+        if key is None:
+            return
+        value = json.dumps([status.value, reason, time.time()])
+        self.redis.setex(key, value, self.timeout)
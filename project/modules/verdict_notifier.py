@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import json
+import time
+
+
+PUBLISH_SCRIPT = """
+local p = ARGV[1]
+local verdict = cjson.decode(ARGV[2])
+verdict.seq = redis.call('INCR', p .. 'seq')
+local raw = cjson.encode(verdict)
+redis.call('RPUSH', p .. 'verdicts', raw)
+redis.call('LTRIM', p .. 'verdicts', -tonumber(ARGV[3]), -1)
+redis.call('EXPIRE', p .. 'seq', ARGV[4])
+redis.call('EXPIRE', p .. 'verdicts', ARGV[4])
+redis.call('PUBLISH', p .. 'events', verdict.seq)
+return verdict.seq
+"""
+
+
+class VerdictNotifier(object):
+    """
+    Recent verdicts of each team in redis, numbered by a per team sequence.
+    Judge workers publish on the team channel, so a poll waits on it instead of
+    reloading the submissions list.
+    """
+    prefix = 'verdicts:'
+
+    def __init__(self, redis_connection, app=None):
+        self.redis = redis_connection
+        self.app = app
+        self._publish = None
+        if app:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        self.app = app
+        self.history = self.app.config['VERDICT_POLL_HISTORY']
+        self.timeout = self.app.config['VERDICT_POLL_TIMEOUT']
+        self.expire = self.app.config['VERDICT_POLL_EXPIRE']
+
+
+    def key(self, cid, tid, name=''):
+        return "%s%s:%s:%s" % (self.prefix, cid, tid, name)
+
+
+    def publish(self, submission_obj):
+        if self._publish is None:
+            self._publish = self.redis.register_script(PUBLISH_SCRIPT)
+
+        data = submission_obj.to_mongo()
+        verdict = dict(
+            id = str(submission_obj.pk),
+            problem = str(data['problem']),
+            submitted_at = submission_obj.submitted_at,
+            status = submission_obj.status.name,
+            reason = submission_obj.reason
+        )
+        key = self.key(data['contest'], data['team'])
+        return self._publish(args=[key, json.dumps(verdict), self.history, self.expire])
+
+
+    def seq(self, cid, tid):
+        return int(self.redis.get(self.key(cid, tid, 'seq')) or 0)
+
+
+    def since(self, cid, tid, seq):
+        """
+        Returns the verdicts after seq (the latest one of each submission),
+        or None when some of them aren't kept anymore.
+        """
+        verdicts = [json.loads(v) for v in self.redis.lrange(self.key(cid, tid, 'verdicts'), 0, -1)]
+        if verdicts and verdicts[0]['seq'] > seq + 1:
+            return None
+        latest = dict((v['id'], v) for v in verdicts if v['seq'] > seq)
+        return sorted(latest.values(), key=lambda v: v['seq'])
+
+
+    def wait(self, cid, tid, seq, timeout):
+        """
+        Blocks until a verdict after seq is published or the timeout passes,
+        returns the verdicts after seq and the current sequence.
+        """
+        pubsub = self.redis.pubsub()
+        pubsub.subscribe(self.key(cid, tid, 'events'))
+        try:
+            ## checked after subscribing, so a verdict published in between isn't missed
+            deadline = time.time() + timeout
+            while self.seq(cid, tid) == seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+        finally:
+            pubsub.close()
+
+        current = self.seq(cid, tid)
+        if current < seq:
+            ## the sequence has expired and started over
+            return None, current
+        return self.since(cid, tid, seq), current
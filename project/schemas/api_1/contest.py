@@ -12,6 +12,7 @@ create_schema = Schema({
     Required('name'): All(unicode, Length(min=1, max=32)),
     Required('starts_at'): int,
     Required('ends_at'): int,
+    Optional('fail_fast'): bool,
     Required('recaptcha'): ReCaptcha()
 })
 
@@ -19,7 +20,8 @@ create_schema = Schema({
 edit_schema = Schema({
     Optional('name'): All(unicode, Length(min=1, max=32)),
     Optional('starts_at'): int,
-    Optional('ends_at'): int
+    Optional('ends_at'): int,
+    Optional('fail_fast'): bool
 })
 
 
@@ -33,14 +35,16 @@ team_join_schema = Schema({
 problem_create_schema = Schema({
     Required('title'): All(unicode, Length(min=1, max=32)),
     Required('time_limit'): All(Any(float, int), Range(min=0.1, max=10.0)),
-    Required('space_limit'): All(int, Range(min=16, max=256))
+    Required('space_limit'): All(int, Range(min=16, max=256)),
+    Optional('check_mode'): All(int, Range(min=0, max=3))
 })
 
 
 problem_edit_schema = Schema({
     Optional('title'): All(unicode, Length(min=1, max=32)),
     Optional('time_limit'): All(Any(float, int), Range(min=0.1, max=10.0)),
-    Optional('space_limit'): All(int, Range(min=16, max=256))
+    Optional('space_limit'): All(int, Range(min=16, max=256)),
+    Optional('check_mode'): All(int, Range(min=0, max=3))
 })
 
 
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+from good import Schema, All, Required, Optional, Range
+
+
+rejudge_schema = Schema({
+    Required('contest_id'): unicode,
+    Optional('problem_id'): unicode,
+    Optional('team_id'): unicode,
+    Optional('status'): All(int, Range(min=1, max=10))
+})
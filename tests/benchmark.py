@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+__author__ = 'AminHP'
+
+# python imports
+import time
+from bson import ObjectId
+
+# project imports
+from project.modules.loader import field_id, field_ids
+from project.models.contest import Contest
+from project.models.submission import Submission
+from project.models.records import ContestRecord, SubmissionRecord, STATUS_NAMES, PROG_LANG_NAMES
+
+
+## raw documents of the list endpoints are mapped into documents (as before) and records,
+## only the fields of the list json are read (references by id, so nothing is fetched)
+
+
+def make_contests(count):
+    now = int(time.time())
+    owner = ObjectId()
+    teams = [ObjectId() for _ in range(20)]
+    return [
+        dict(
+            _id = ObjectId(),
+            name = 'contest %s' % i,
+            owner = owner,
+            admins = [owner],
+            created_at = now,
+            starts_at = now + i,
+            ends_at = now + i + 3600,
+            fail_fast = True,
+            pending_teams = teams[:5],
+            accepted_teams = teams[5:]
+        )
+        for i in range(count)
+    ]
+
+
+def make_submissions(count):
+    contest, problem, team, user = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    now = int(time.time())
+    return [
+        dict(
+            _id = ObjectId(),
+            filename = 'main.cpp',
+            prog_lang = i % 5,
+            submitted_at = now + i,
+            contest = contest,
+            problem = problem,
+            team = team,
+            user = user,
+            status = i % 10,
+            reason = None
+        )
+        for i in range(count)
+    ]
+
+
+def read_contest_document(doc):
+    c = Contest._from_son(doc)
+    return (
+        c.pk, c.name, field_id(c, 'owner'), c.created_at, c.starts_at, c.ends_at, c.fail_fast,
+        len(field_ids(c, 'pending_teams')), len(field_ids(c, 'accepted_teams'))
+    )
+
+
+def read_contest_record(doc):
+    c = ContestRecord(doc)
+    return (
+        c.id, c.name, c.owner, c.created_at, c.starts_at, c.ends_at, c.fail_fast,
+        len(c.pending_teams), len(c.accepted_teams)
+    )
+
+
+def read_submission_document(doc):
+    s = Submission._from_son(doc)
+    return (
+        s.pk, s.filename, s.prog_lang.name, s.submitted_at,
+        field_id(s, 'problem'), field_id(s, 'user'), s.status.name, s.reason
+    )
+
+
+def read_submission_record(doc):
+    s = SubmissionRecord(doc)
+    return (
+        s.id, s.filename, PROG_LANG_NAMES[s.prog_lang], s.submitted_at,
+        s.problem, s.user, STATUS_NAMES[s.status], s.reason
+    )
+
+
+def measure(read, docs):
+    started = time.time()
+    for doc in docs:
+        read(doc)
+    return len(docs) / max(time.time() - started, 1e-9)
+
+
+def run(count):
+    benchmarks = [
+        ('contest', make_contests(count), read_contest_document, read_contest_record),
+        ('submission', make_submissions(count), read_submission_document, read_submission_record)
+    ]
+    for name, docs, read_document, read_record in benchmarks:
+        before = measure(read_document, docs)
+        after = measure(read_record, docs)
+        print '%-12s document: %10.0f/sec   record: %10.0f/sec   (x%.1f)' % (name, before, after, after / before)